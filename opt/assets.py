@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import pygame as pg
+
+# ---------------- 画像の読み込み ----------------
+# 元のPNGは1回だけデコードして、(名前, 大きさ) ごとに縮小したものを持っておく。
+# 縮小したものはディスクにも保存して、次に起動したときは元のPNGより新しければそれを使う。
+# 読み込みは全部1本のスレッドでやるので、同じファイルを2回デコードすることはない。
+# preload() しておけば、使うときにはもう読み終わっている
+MONSTER_FILES = {
+    "スライム": "slime.png", "ゴブリン": "goblin.png",
+    "オオコウモリ": "bat.png", "ウェアウルフ": "werewolf.png",
+    "ドラゴン": "dragon.png",
+    "青龍": "seiryu.png", "朱雀": "suzaku.png",
+    "白虎": "byakko.png", "玄武": "genbu.png",
+}
+MONSTER_DIR = os.path.join("assets", "monsters")
+
+class AssetManager:
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+        # 名前 -> デコードしただけの元画像 (読み込み用スレッドからしか触らない)
+        self._raw = {}
+        # (名前, (w, h)) -> 読み込み中/読み終わった Future
+        self._jobs = {}
+        # (名前, (w, h)) -> convert_alpha 済みの Surface
+        self._images = {}
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="assets")
+        # 何回デコードしたか / ディスクのキャッシュを使ったか
+        self.decoded = 0
+        self.disk_hits = 0
+
+    def preload(self, name: str, size: tuple[int, int]):
+        # 裏で読み始めるだけ。終わるのは待たない
+        key = (name, tuple(size))
+        if key not in self._jobs:
+            self._jobs[key] = self._worker.submit(self._load, name, key[1])
+
+    def image(self, name: str, size: tuple[int, int]) -> pg.Surface:
+        key = (name, tuple(size))
+        img = self._images.get(key)
+        if img is None:
+            self.preload(name, size)
+            # convert は画面を持っているメインスレッドでやる
+            img = self._jobs[key].result().convert_alpha()
+            self._images[key] = img
+        return img
+
+    def close(self):
+        self._worker.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, name: str, size: tuple[int, int]) -> pg.Surface:
+        fn = MONSTER_FILES.get(name)
+        path = os.path.join(MONSTER_DIR, fn) if fn else None
+        if path is None or not os.path.exists(path):
+            surf = pg.Surface(size, pg.SRCALPHA)
+            surf.fill((60, 60, 60, 200))
+            return surf
+
+        cache = self._cache_path(fn, size)
+        if cache is not None and os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+            try:
+                surf = pg.image.load(cache)
+                self.disk_hits += 1
+                return surf
+            except (pg.error, OSError):
+                pass
+
+        raw = self._raw.get(name)
+        if raw is None:
+            raw = pg.image.load(path)
+            if raw.get_bitsize() not in (24, 32):
+                # smoothscale は 24/32bit しか受け付けない (パレットのPNGなど)
+                full = pg.Surface(raw.get_size(), pg.SRCALPHA, 32)
+                full.blit(raw, (0, 0))
+                raw = full
+            self._raw[name] = raw
+            self.decoded += 1
+        surf = pg.transform.smoothscale(raw, size)
+
+        if cache is not None:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp = cache + ".tmp.png"
+                pg.image.save(surf, tmp)
+                os.replace(tmp, cache)
+            except (pg.error, OSError):
+                pass
+        return surf
+
+    def _cache_path(self, fn: str, size: tuple[int, int]) -> Optional[str]:
+        if self.cache_dir is None:
+            return None
+        stem = os.path.splitext(fn)[0]
+        return os.path.join(self.cache_dir, f"{stem}_{size[0]}x{size[1]}.png")
@@ -0,0 +1,175 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from board import GEMS, GEM_INDEX, find_clusters
+
+# ---------------- NumPyでまとめて盤面を回す ----------------
+# 盤面は (N, 5, 6) の整数配列。0..4 が GEMS の順番、EMPTY が「無」
+EMPTY = len(GEMS)
+
+def field_to_codes(field) -> np.ndarray:
+    return np.array([[GEM_INDEX.get(e, EMPTY) for e in row] for row in field], dtype=np.int8)
+
+def codes_to_field(codes) -> list:
+    names = GEMS + ["無"]
+    return [[names[c] for c in row] for row in codes]
+
+def random_boards(n: int, rng: np.random.Generator, rows: int = 5, cols: int = 6) -> np.ndarray:
+    return rng.integers(0, len(GEMS), size=(n, rows, cols), dtype=np.int8)
+
+def match_cells(boards: np.ndarray) -> np.ndarray:
+    # scan_grid と同じく、縦横に3つ以上並んだ「無」以外のマス
+    matched = np.zeros(boards.shape, dtype=bool)
+
+    a, b, c = boards[:, :, :-2], boards[:, :, 1:-1], boards[:, :, 2:]
+    h = (a == b) & (b == c) & (a != EMPTY)
+    matched[:, :, :-2] |= h
+    matched[:, :, 1:-1] |= h
+    matched[:, :, 2:] |= h
+
+    a, b, c = boards[:, :-2, :], boards[:, 1:-1, :], boards[:, 2:, :]
+    v = (a == b) & (b == c) & (a != EMPTY)
+    matched[:, :-2, :] |= v
+    matched[:, 1:-1, :] |= v
+    matched[:, 2:, :] |= v
+    return matched
+
+def label_clusters(boards: np.ndarray, matched: np.ndarray) -> np.ndarray:
+    # 同じ色でつながっているマッチ済みマスに、塊の中で一番小さいマス番号を配る
+    n, rows, cols = boards.shape
+    none = rows * cols
+    idx = np.arange(none, dtype=np.int16).reshape(1, rows, cols)
+    labels = np.where(matched, idx, none).astype(np.int16)
+
+    same_x = matched[:, :, 1:] & matched[:, :, :-1] & (boards[:, :, 1:] == boards[:, :, :-1])
+    same_y = matched[:, 1:, :] & matched[:, :-1, :] & (boards[:, 1:, :] == boards[:, :-1, :])
+
+    while True:
+        new = labels.copy()
+        np.minimum(new[:, :, 1:], np.where(same_x, labels[:, :, :-1], none), out=new[:, :, 1:])
+        np.minimum(new[:, :, :-1], np.where(same_x, labels[:, :, 1:], none), out=new[:, :, :-1])
+        np.minimum(new[:, 1:, :], np.where(same_y, labels[:, :-1, :], none), out=new[:, 1:, :])
+        np.minimum(new[:, :-1, :], np.where(same_y, labels[:, 1:, :], none), out=new[:, :-1, :])
+        if np.array_equal(new, labels):
+            return labels
+        labels = new
+
+def apply_gravity(boards: np.ndarray) -> np.ndarray:
+    # animation_fall と同じく、列ごとに「無」を上へ、残ったジェムは順番を保ったまま下へ
+    rows = boards.shape[1]
+    ys = np.arange(rows, dtype=np.int16).reshape(1, rows, 1)
+    key = (boards != EMPTY) * rows + ys
+    order = np.argsort(key, axis=1, kind="stable")
+    return np.take_along_axis(boards, order, axis=1)
+
+def step_scores(boards: np.ndarray, matched: np.ndarray):
+    # 1回分の消去で増えるコンボ数と属性ごとの to_do
+    n, rows, cols = boards.shape
+    labels = label_clusters(boards, matched)
+    roots = matched & (labels == np.arange(rows * cols).reshape(1, rows, cols))
+
+    flat = boards.reshape(n, -1).astype(np.int64) + np.arange(n).reshape(n, 1) * len(GEMS)
+    clusters = np.bincount(flat[roots.reshape(n, -1)], minlength=n * len(GEMS)).reshape(n, len(GEMS))
+    cells = np.bincount(flat[matched.reshape(n, -1)], minlength=n * len(GEMS)).reshape(n, len(GEMS))
+
+    # 塊ごとの 1.00 + (count - 3) * 0.8 を属性ごとに足したもの
+    to_do = cells * 0.8 - clusters * 1.4
+    return clusters.sum(axis=1), to_do
+
+def run_cascade(boards: np.ndarray, rng: np.random.Generator, skyfall: bool = True):
+    # 盤面はその場で書き換える。返り値は (コンボ数 (N,), to_do (N, 5))
+    # skyfall=False だと補充なし(落ちてきた分の連鎖だけ数える)
+    n = boards.shape[0]
+    combos = np.zeros(n, dtype=np.int32)
+    to_do = np.zeros((n, len(GEMS)), dtype=np.float64)
+
+    active = np.arange(n)
+    while active.size:
+        sub = boards[active]
+        matched = match_cells(sub)
+        hit = matched.any(axis=(1, 2))
+        if not hit.all():
+            active, sub, matched = active[hit], sub[hit], matched[hit]
+            if not active.size:
+                break
+
+        c, t = step_scores(sub, matched)
+        combos[active] += c
+        to_do[active] += t
+
+        sub[matched] = EMPTY
+        sub = apply_gravity(sub)
+        if skyfall:
+            holes = sub == EMPTY
+            sub[holes] = rng.integers(0, len(GEMS), size=int(holes.sum()), dtype=np.int8)
+        boards[active] = sub
+
+    return combos, to_do
+
+def to_do_dicts(to_do: np.ndarray) -> list:
+    return [{g: float(row[i]) for i, g in enumerate(GEMS)} for row in to_do]
+
+# ---------------- 比較用 (1盤面ずつ) ----------------
+def python_cascade(field, rng):
+    combo = 0
+    to_do = {g: 0 for g in GEMS}
+    rows = len(field)
+    cols = len(field[0])
+    while True:
+        clusters = find_clusters(field)
+        if not clusters:
+            break
+        for cluster in clusters:
+            combo += 1
+            to_do[cluster["color"]] += 1.00 + (cluster["count"] - 3) * 0.8
+            for gx, gy in cluster["coords"]:
+                field[gy][gx] = "無"
+        for x in range(cols):
+            col = [field[y][x] for y in range(rows) if field[y][x] != "無"]
+            col = [rng.choice(GEMS) for _ in range(rows - len(col))] + col
+            for y in range(rows):
+                field[y][x] = col[y]
+    return combo, to_do
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=100000, help="盤面の数")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    boards = random_boards(args.n, rng)
+
+    # 1回目の消去は乱数に関係ないので、1盤面ずつの結果と一致するはず
+    sample = boards[:2000].copy()
+    c, t = step_scores(sample, match_cells(sample))
+    for i, b in enumerate(sample):
+        clusters = find_clusters(codes_to_field(b))
+        want = {g: 0.0 for g in GEMS}
+        for cl in clusters:
+            want[cl["color"]] += 1.00 + (cl["count"] - 3) * 0.8
+        got = to_do_dicts(t[i:i + 1])[0]
+        if c[i] != len(clusters) or any(abs(want[g] - got[g]) > 1e-9 for g in GEMS):
+            raise SystemExit(f"結果が一致しません: {b.tolist()}")
+
+    py_n = min(args.n, 5000)
+    py_rng = random.Random(args.seed)
+    fields = [codes_to_field(b) for b in boards[:py_n]]
+    start = time.perf_counter()
+    for f in fields:
+        python_cascade(f, py_rng)
+    py_rate = py_n / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    combos, to_do = run_cascade(boards, rng)
+    np_rate = args.n / (time.perf_counter() - start)
+
+    print(f"boards: {args.n}  平均コンボ: {combos.mean():.2f}  最大: {combos.max()}")
+    print(f"1盤面ずつ (python) : {py_rate:12,.0f} boards/s")
+    print(f"まとめて (numpy)   : {np_rate:12,.0f} boards/s  x{np_rate / py_rate:.1f}")
+
+if __name__ == "__main__":
+    main()
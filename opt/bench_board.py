@@ -0,0 +1,98 @@
+import argparse
+import random
+import time
+
+from board import (GEMS, BOARD_ROWS, BOARD_COLS, scan_grid, get_clusters, find_clusters, to_bitboards,
+                   bit_clusters, resolve_turn)
+
+# ---------------- 盤面判定のマイクロベンチ ----------------
+# python3 bench_board.py -n 20000
+# 盤面の大きさ (列x行) ごとの連鎖の速さ。1マスあたりの時間がほぼ同じなら、マスの数に比例している
+SIZES = [(5, 6), (6, 8), (8, 10), (10, 12), (10, 14)]
+
+def make_corpus(n: int, seed: int, rows: int = BOARD_ROWS, cols: int = BOARD_COLS) -> list:
+    rng = random.Random(seed)
+    return [[[rng.choice(GEMS) for x in range(cols)] for y in range(rows)] for _ in range(n)]
+
+def old_engine(field):
+    return get_clusters(field, scan_grid(field))
+
+def new_engine(field):
+    return find_clusters(field)
+
+def bits_only(boards):
+    return bit_clusters(boards, 5, 6)
+
+def boards_per_sec(fn, corpus, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for b in corpus:
+            fn(b)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+def cascade_per_sec(corpus, seed: int, repeat: int) -> float:
+    # 描画なしで1ターン(連鎖・落下・補充まで)を解決する速さ。盤面は書き換わるので毎回コピーする
+    best = float("inf")
+    for _ in range(repeat):
+        rng = random.Random(seed)
+        fields = [[row[:] for row in b] for b in corpus]
+        start = time.perf_counter()
+        for f in fields:
+            resolve_turn(f, rng)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+def waves_per_turn(corpus, seed: int) -> float:
+    # 1ターンで落下・補充が何回あったか。大きい盤面ほど連鎖が続くので、1ターンの仕事も増える
+    rng = random.Random(seed)
+    waves = 0
+    for b in corpus:
+        events = resolve_turn([row[:] for row in b], rng)
+        waves += sum(1 for ev in events if ev["type"] == "fall")
+    return waves / len(corpus)
+
+def same_result(a: list, b: list) -> bool:
+    key = lambda c: (c["color"], sorted(c["coords"]))
+    return sorted(map(key, a)) == sorted(map(key, b))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20000, help="盤面の数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    corpus = make_corpus(args.n, args.seed)
+
+    # 念の為、結果が一致しているか確認
+    for b in corpus:
+        if not same_result(old_engine(b), new_engine(b)):
+            raise SystemExit(f"結果が一致しません: {b}")
+
+    encoded = [to_bitboards(b) for b in corpus]
+
+    old = boards_per_sec(old_engine, corpus, args.repeat)
+    new = boards_per_sec(new_engine, corpus, args.repeat)
+    raw = boards_per_sec(bits_only, encoded, args.repeat)
+
+    print(f"boards: {args.n}")
+    print(f"scan_grid + get_clusters : {old:12,.0f} boards/s")
+    print(f"find_clusters (bitboard) : {new:12,.0f} boards/s  x{new / old:.2f}")
+    print(f"bit_clusters (変換済み)  : {raw:12,.0f} boards/s  x{raw / old:.2f}")
+
+    # 描画なしで1ターン(連鎖・落下・補充まで)を解決する速さ
+    turns = cascade_per_sec(corpus, args.seed, args.repeat)
+    print(f"resolve_turn (描画なし)  : {turns:12,.0f} turns/s")
+
+    print("盤面の大きさごとの resolve_turn")
+    for rows, cols in SIZES:
+        sized = make_corpus(max(1, args.n * BOARD_ROWS * BOARD_COLS // (rows * cols)), args.seed, rows, cols)
+        turns = cascade_per_sec(sized, args.seed, args.repeat)
+        waves = waves_per_turn(sized, args.seed)
+        print(f"  {cols:2d}x{rows:<2d} : {turns:12,.0f} turns/s  連鎖 {waves:4.2f} 回/ターン  "
+              f"{1e9 / (turns * rows * cols * max(1.0, waves)):6,.0f} ns/マス/回")
+
+if __name__ == "__main__":
+    main()
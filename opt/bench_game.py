@@ -0,0 +1,339 @@
+import argparse
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# 画面なしで動かす
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame as pg
+
+import pazmon
+import rules
+from bench_board import SIZES, make_corpus, boards_per_sec, cascade_per_sec, old_engine, new_engine
+from record import RngStreams
+from timeline import Timeline
+from compositor import Compositor
+from assets import AssetManager
+from savegame import dump_game, load_game
+from board import BOARD_ROWS, BOARD_COLS, resolve_turn
+
+# ---------------- ゲーム全体のベンチマーク ----------------
+# python3 bench_game.py                  計測して bench_result.json に書き、基準と比べる
+# python3 bench_game.py --save-baseline  今の結果を基準 (bench_baseline.json) にする
+# 基準より threshold 以上遅くなった項目があれば終了コード 1
+# 基準はマシンごとに違うので、リポジトリには入れない (最初に --save-baseline で作る)
+BENCH_VERSION = 2
+SETTLE_FRAMES = 300  # 1ターンの再生を待つフレーム数 (1/60秒ずつ進めるので5秒)
+CUTIN_FRAMES = 150
+
+# 値が大きいほど良いもの
+HIGHER_IS_BETTER = {"game_fps", "scan_grid_get_clusters_boards_s", "find_clusters_boards_s"}
+HIGHER_IS_BETTER |= {f"cascade_{c}x{r}_turns_s" for r, c in SIZES}
+
+def cell_pos(x, y):
+    step = pazmon.SLOT_W + pazmon.SLOT_PAD
+    return (pazmon.LEFT_MARGIN + x * step + pazmon.SLOT_W // 2, pazmon.FIELD_Y + y * step + pazmon.SLOT_W // 2)
+
+def scripted_inputs(turns: int, seed: int, counter: dict, rows: int = BOARD_ROWS, cols: int = BOARD_COLS):
+    # ドラッグとスキルのクリックを1フレーム分ずつ返す。counter["frames"] に進んだフレーム数を数える
+    rng = random.Random(seed)
+
+    def frame(events):
+        counter["frames"] += 1
+        return events
+
+    for t in range(turns):
+        if t % 4 == 3:
+            # スキル (たまっていなければ何も起きない)
+            i = rng.randrange(len(rules.partylist))
+            pos = (pazmon.MEMBER_LEFT + i * (pazmon.MEMBER_W + pazmon.MEMBER_PAD) + pazmon.MEMBER_W // 2,
+                   int(pazmon.WIN_H * 0.4) + pazmon.MEMBER_W // 2)
+            yield frame([pg.event.Event(pg.MOUSEBUTTONDOWN, button=1, pos=pos)])
+            yield frame([pg.event.Event(pg.MOUSEBUTTONUP, button=1, pos=pos)])
+            for _ in range(CUTIN_FRAMES):
+                yield frame([])
+
+        x, y = rng.randrange(cols), rng.randrange(rows)
+        yield frame([pg.event.Event(pg.MOUSEBUTTONDOWN, button=1, pos=cell_pos(x, y))])
+        for _ in range(8):
+            x = min(cols - 1, max(0, x + rng.choice((-1, 0, 1))))
+            y = min(rows - 1, max(0, y + rng.choice((-1, 0, 1))))
+            yield frame([pg.event.Event(pg.MOUSEMOTION, pos=cell_pos(x, y), rel=(0, 0), buttons=(1, 0, 0))])
+        yield frame([pg.event.Event(pg.MOUSEBUTTONUP, button=1, pos=cell_pos(x, y))])
+        for _ in range(SETTLE_FRAMES):
+            yield frame([])
+
+def bench_sizes(n: int, seed: int, calls: int, repeat: int) -> dict:
+    # 盤面の大きさごとに、連鎖の解決 (描画なし) の速さと、落下中の1フレームを描いて送るまでの時間
+    result = {}
+    for rows, cols in SIZES:
+        name = f"{cols}x{rows}"
+        corpus = make_corpus(max(1, n * BOARD_ROWS * BOARD_COLS // (rows * cols)), seed, rows, cols)
+        result[f"cascade_{name}_turns_s"] = cascade_per_sec(corpus, seed, repeat)
+
+        screen = pazmon.open_window(rows, cols)
+        font = pazmon.get_jp_font(20)
+        pazmon.build_gem_atlas(font)
+        game = rules.new_game(RngStreams(seed), rows, cols)
+        pazmon.load_unit_images(game, font, AssetManager())
+        timeline = Timeline()
+        comp = Compositor(screen, pazmon.LAYERS)
+        field_layer = pazmon.FieldLayer()
+        view = [row[:] for row in game.field]
+        comp.set_background(lambda s: pazmon.draw_background(s, view))
+
+        # 連鎖の最初の落下を再生しながら、カーソルを盤面の上で動かす
+        events = resolve_turn([row[:] for row in game.field], random.Random(seed))
+        fall = next((ev for ev in events if ev["type"] == "fall"), {"moves": []})
+        spawn = next((ev for ev in events if ev["type"] == "spawn"), {"gems": []})
+        falling = pazmon.fall_anims(view, fall["moves"], spawn["gems"])
+
+        def frame(i):
+            hover = (i % cols, (i // cols) % rows)
+            pazmon.compose_top(comp, game.enemy, game.party, font, game.sukill_turn, timeline)
+            field_layer.compose(comp, view, timeline, hover_pos=hover, falling=falling)
+            pazmon.animation_fall(comp, falling, (i % 60) / 60)
+            comp.present()
+        result[f"frame_{name}_ms"] = ms_per_call(frame, calls)
+    return result
+
+def bench_session(turns: int, seed: int) -> dict:
+    # main() をそのまま動かして、イベント処理から画面転送までを通す
+    counter = {"frames": 0}
+    tmp = tempfile.mkdtemp(prefix="pazmon_bench_")
+    csv_path = os.path.join(tmp, "frametime.csv")
+
+    start = time.perf_counter()
+    try:
+        pazmon.main(seed, os.path.join(tmp, "log.json"), frametime_csv=csv_path, fps=0, fixed_dt=1 / 60,
+                    inputs=scripted_inputs(turns, seed, counter), save_path=os.path.join(tmp, "save.sav"))
+    except SystemExit:
+        pass
+    elapsed = time.perf_counter() - start
+
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        totals = sorted(float(r["total_ms"]) for r in csv.DictReader(f))
+    return {
+        "game_fps": counter["frames"] / elapsed,
+        "game_frame_p95_ms": totals[min(len(totals) - 1, int(0.95 * len(totals)))],
+    }
+
+def ms_per_call(fn, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1000
+
+def bench_draw(seed: int, n: int) -> dict:
+    # main() が1フレームで描くのと同じ部品 (上半分 / 盤面 / 落下 / 画面への転送) を区間ごとに測る。
+    # 攻撃を受けている最中のフレーム: 敵とパーティが揺れてHPが減り、マスが脈打ち、カーソルが動く
+    screen = pazmon.open_window()
+    font = pazmon.get_jp_font(20)
+    pazmon.build_gem_atlas(font)
+    game = rules.new_game(RngStreams(seed))
+    pazmon.load_unit_images(game, font, AssetManager())
+    rows, cols = len(game.field), len(game.field[0])
+    timeline = Timeline()
+    comp = Compositor(screen, pazmon.LAYERS)
+    field_layer = pazmon.FieldLayer()
+    view = [row[:] for row in game.field]
+    comp.set_background(lambda s: pazmon.draw_background(s, view))
+
+    events = resolve_turn([row[:] for row in game.field], random.Random(seed))
+    fall = next(ev for ev in events if ev["type"] == "fall")
+    spawn = next(ev for ev in events if ev["type"] == "spawn")
+    falling = pazmon.fall_anims(view, fall["moves"], spawn["gems"])
+    enemy = game.enemy
+
+    phases = ("compose_top", "compose_field", "animation_fall", "present")
+    totals = dict.fromkeys(phases, 0.0)
+    for i in range(n):
+        if i % 30 == 0:
+            timeline.tween("hit_enemy", 0.5)
+            timeline.tween("hit_party", 0.5)
+            timeline.cell_tween("pulse", i % cols, (i // cols) % rows, 0.5, "pulse")
+        timeline.update(1 / 60)
+        enemy.hp = enemy.max_hp - i % 50
+
+        t0 = time.perf_counter()
+        pazmon.compose_top(comp, enemy, game.party, font, game.sukill_turn, timeline)
+        t1 = time.perf_counter()
+        field_layer.compose(comp, view, timeline, hover_pos=(i % cols, (i // cols) % rows), falling=falling)
+        t2 = time.perf_counter()
+        pazmon.animation_fall(comp, falling, (i % 60) / 60)
+        t3 = time.perf_counter()
+        comp.present()
+        t4 = time.perf_counter()
+        for name, a, b in zip(phases, (t0, t1, t2, t3), (t1, t2, t3, t4)):
+            totals[name] += b - a
+    return {f"{name}_ms": total / n * 1000 for name, total in totals.items()}
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps([time.perf_counter() - start, "pygame" in sys.modules]))
+"""
+
+def bench_import(repeat: int) -> dict:
+    # import にかかる時間。毎回まっさらなプロセスで測って、一番速かった回を使う
+    # rules は pygame なしで読めること (シミュレーターの子プロセスが SDL を立ち上げない)
+    result = {}
+    for module in ("rules", "pazmon"):
+        best = float("inf")
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+                                 capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            elapsed, uses_pygame = json.loads(out.stdout.splitlines()[-1])
+            best = min(best, elapsed)
+            if module == "rules" and uses_pygame:
+                raise RuntimeError("rules を import すると pygame も読み込まれています")
+        result[f"import_{module}_ms"] = best * 1000
+    return result
+
+FONT_SNIPPET = """
+import json, os, time
+import pygame as pg
+import pygame.sysfont as sysfont
+calls = []
+real = sysfont.initsysfonts
+def counted():
+    calls.append(1)
+    return real()
+sysfont.initsysfonts = counted
+pg.font.init()
+import pazmon
+# 日本語フォントが見つからなかったときのインデックス (Docker のイメージなど)
+os.makedirs(pazmon.CACHE_DIR, exist_ok=True)
+with open(pazmon.FONT_INDEX, "w", encoding="utf-8") as f:
+    json.dump({{"stamp": pazmon.font_dirs_stamp(), "path": None}}, f)
+start = time.perf_counter()
+pazmon.get_jp_font(20)
+print(json.dumps([time.perf_counter() - start, len(calls)]))
+"""
+
+def bench_font(repeat: int) -> dict:
+    # 2回目からの起動 (インデックスに "path": null) でフォントを開く時間。
+    # システムのフォントを全部見に行く (initsysfonts) と遅いので、呼んでいたら失敗にする
+    best = float("inf")
+    here = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="pazmon_font_") as cache:
+            env = dict(os.environ, XDG_CACHE_HOME=cache)
+            out = subprocess.run([sys.executable, "-c", FONT_SNIPPET.format()], capture_output=True, text=True,
+                                 check=True, cwd=here, env=env)
+        elapsed, enumerated = json.loads(out.stdout.splitlines()[-1])
+        if enumerated:
+            raise RuntimeError("フォントのインデックスがあるのに、システムのフォントを全部見に行っています")
+        best = min(best, elapsed)
+    return {"font_warm_start_ms": best * 1000}
+
+def bench_save(n: int) -> dict:
+    # オートセーブ1回分 (バイト列にする / 読み戻す)。負のシードと64ビットの端でも元に戻ること
+    for seed in (-1, -2 ** 63, 2 ** 63 - 1):
+        game = rules.new_game(RngStreams(seed))
+        back = load_game(dump_game(game))
+        if back.streams.seed != seed or back.field != game.field:
+            raise RuntimeError(f"シード {seed} のセーブデータが元に戻りません")
+    game = rules.new_game(RngStreams(-1))
+    data = dump_game(game)
+    return {
+        "save_dump_ms": ms_per_call(lambda i: dump_game(game), n),
+        "save_load_ms": ms_per_call(lambda i: load_game(data), n),
+    }
+
+def bench_scan(n: int, seed: int, repeat: int) -> dict:
+    corpus = make_corpus(n, seed)
+    return {
+        "scan_grid_get_clusters_boards_s": boards_per_sec(old_engine, corpus, repeat),
+        "find_clusters_boards_s": boards_per_sec(new_engine, corpus, repeat),
+    }
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    # (名前, 今回, 基準, 比, 遅くなったか)
+    rows = []
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, value, None, None, False))
+            continue
+        ratio = value / base if base else float("inf")
+        if name in HIGHER_IS_BETTER:
+            slower = ratio < 1 - threshold
+        else:
+            slower = ratio > 1 + threshold
+        rows.append((name, value, base, ratio, slower))
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=20, help="main() で動かすターン数")
+    ap.add_argument("--calls", type=int, default=300, help="描画関数を呼ぶ回数")
+    ap.add_argument("-n", type=int, default=20000, help="盤面判定に使う盤面の数")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="bench_result.json")
+    ap.add_argument("--baseline", default="bench_baseline.json")
+    ap.add_argument("--save-baseline", action="store_true", help="今回の結果を基準として保存する")
+    ap.add_argument("--threshold", type=float, default=0.15, help="これ以上遅くなったら失敗 (0.15 = 15%%)")
+    args = ap.parse_args()
+
+    results = {}
+    results.update(bench_import(args.repeat))
+    results.update(bench_font(args.repeat))
+    results.update(bench_scan(args.n, args.seed, args.repeat))
+    results.update(bench_draw(args.seed, args.calls))
+    results.update(bench_save(args.calls))
+    results.update(bench_sizes(args.n // 4, args.seed, args.calls, args.repeat))
+    # main() は終わるときに pg.quit() するので最後
+    results.update(bench_session(args.turns, args.seed))
+
+    report = {
+        "version": BENCH_VERSION,
+        "python": sys.version.split()[0],
+        "pygame": pg.version.ver,
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基準を保存しました: {args.baseline}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("version") == BENCH_VERSION:
+            baseline = saved["results"]
+        else:
+            # 測る項目が変わっているので比べない
+            print(f"{args.baseline} は古い形式です。--save-baseline で作り直してください")
+    else:
+        # 基準は計測したマシンでしか意味がないので、リポジトリには入れていない
+        print(f"{args.baseline} がありません。変更前に --save-baseline で作ってください (今回は比べません)")
+
+    failed = False
+    for name, value, base, ratio, slower in compare(results, baseline, args.threshold):
+        if base is None:
+            print(f"{name:<34}{value:14,.3f}")
+            continue
+        mark = "  <- 遅くなっています" if slower else ""
+        print(f"{name:<34}{value:14,.3f}  (基準 {base:,.3f}  x{ratio:.2f}){mark}")
+        failed = failed or slower
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+from board import BOARD_ROWS, BOARD_COLS, parse_size
+from record import encode_path
+from simulate import random_path
+
+# ---------------- サーバーの負荷テスト ----------------
+# python3 bench_server.py -c 300 --turns 30           server.py を子プロセスで立ち上げて測る
+# python3 bench_server.py --connect 127.0.0.1:8765    立ち上がっているサーバーに (--unix PATH も可)
+# クライアント1つが1つのゲームを遊ぶ。スキルは使えるようになったらすぐ使い、ドラッグは10マスでたらめ。
+# ゲームが終わったら次の seed で new し直して、決めたターン数まで続ける
+
+async def client(n: int, args, latencies: list, counts: dict):
+    if args.unix:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        host, _, port = args.connect.rpartition(":")
+        reader, writer = await asyncio.open_connection(host, int(port))
+    rng = random.Random(f"{args.seed + n}:client")
+    rows, cols = args.size
+
+    async def request(req: dict) -> dict:
+        start = time.perf_counter()
+        writer.write(json.dumps(req, separators=(",", ":")).encode("utf-8") + b"\n")
+        line = await reader.readline()
+        latencies.append(time.perf_counter() - start)
+        out = json.loads(line)
+        if "error" in out:
+            raise RuntimeError(f"サーバーがエラーを返しました: {out['error']} ({req})")
+        return out
+
+    size = f"{cols}x{rows}"
+    games = 0
+    state = await request({"op": "new", "seed": (args.seed + n) * 1000, "size": size})
+    ready = state["ready"]
+    for _ in range(args.turns):
+        for i in ready:
+            out = await request({"op": "skill", "index": i})
+            counts["skills"] += 1
+            if "over" in out:
+                break
+        else:
+            out = await request({"op": "turn", "path": encode_path(random_path(rng, rows, cols, 10))})
+            counts["turns"] += 1
+        ready = out.get("ready", ready)
+        if "over" in out:
+            games += 1
+            state = await request({"op": "new", "seed": (args.seed + n) * 1000 + games, "size": size})
+            ready = state["ready"]
+    counts["games"] += games
+    writer.close()
+
+async def spawn_server(args):
+    # どこから起動しても、このファイルの隣の server.py を使う
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+    proc = await asyncio.create_subprocess_exec(sys.executable, server, "--port", "0",
+                                                stdout=asyncio.subprocess.PIPE)
+    line = (await proc.stdout.readline()).decode()
+    if not line.startswith("listening "):
+        raise RuntimeError("server.py が立ち上がりませんでした")
+    args.connect = line.split()[1]
+    return proc
+
+def percentile(s: list, p: float) -> float:
+    return s[min(len(s) - 1, int(p / 100 * len(s)))]
+
+async def run(args):
+    proc = None
+    if not args.connect and not args.unix:
+        proc = await spawn_server(args)
+    latencies = []
+    counts = {"turns": 0, "skills": 0, "games": 0}
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(n, args, latencies, counts) for n in range(args.clients)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if proc is not None:
+            proc.terminate()
+            await proc.wait()
+
+    s = sorted(latencies)
+    print(f"{args.clients} セッション  {args.size[1]}x{args.size[0]}  {elapsed:.2f} 秒")
+    print(f"ターン {counts['turns']:,}  スキル {counts['skills']:,}  終わったゲーム {counts['games']:,}")
+    print(f"{counts['turns'] / elapsed:,.0f} ターン/秒   {len(s) / elapsed:,.0f} 要求/秒")
+    print(f"応答時間 ms: p50 {percentile(s, 50) * 1000:.2f}  p95 {percentile(s, 95) * 1000:.2f}  "
+          f"p99 {percentile(s, 99) * 1000:.2f}  最大 {s[-1] * 1000:.2f}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-c", "--clients", type=int, default=300, help="同時につなぐセッションの数")
+    ap.add_argument("--turns", type=int, default=30, help="1セッションあたりの要求の数 (ターンかスキル)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--size", type=parse_size, default=(BOARD_ROWS, BOARD_COLS), help="盤面の大きさ 列x行")
+    ap.add_argument("--connect", default=None, help="HOST:PORT。省略すると server.py を立ち上げる")
+    ap.add_argument("--unix", default=None, help="Unix ソケットでつなぐ")
+    args = ap.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
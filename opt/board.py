@@ -0,0 +1,360 @@
+import random
+from functools import lru_cache
+from typing import List, Tuple
+
+# ---------------- 定義 ----------------
+GEMS = ["火", "水", "風", "土", "命"]
+GEM_INDEX = {g: i for i, g in enumerate(GEMS)}
+SLOTS = [chr(ord('A')+i) for i in range(14)]
+
+# 盤面の大きさ (列, 行)。6x5 から 14x10 まで。
+# 列は SLOTS の英字、行はログの数字1桁で書くので、これより大きくはできない
+BOARD_COLS, BOARD_ROWS = 6, 5
+MIN_COLS, MIN_ROWS = 6, 5
+MAX_COLS, MAX_ROWS = len(SLOTS), 10
+
+def check_size(rows: int, cols: int):
+    if not (MIN_COLS <= cols <= MAX_COLS and MIN_ROWS <= rows <= MAX_ROWS):
+        raise ValueError(f"盤面の大きさは {MIN_COLS}x{MIN_ROWS} から {MAX_COLS}x{MAX_ROWS} までです: {cols}x{rows}")
+
+def parse_size(text: str) -> Tuple[int, int]:
+    # コマンドラインの "8x6" (列x行) を (行, 列) にする
+    cols, _, rows = text.lower().partition("x")
+    rows, cols = int(rows), int(cols)
+    check_size(rows, cols)
+    return rows, cols
+
+# ---------------- 盤面ロジック ----------------
+def init_field(rng=random, rows: int = BOARD_ROWS, cols: int = BOARD_COLS)->List[List[str]]:
+    check_size(rows, cols)
+    return [[rng.choice(GEMS) for i in range(cols)] for j in range(rows)]
+
+def get_all_runs(line: List[str]) -> List[Tuple[int, int]]:
+    runs = []
+    n = len(line)
+    i = 0
+    while i < n:
+        j = i + 1
+        while j < n and line[j] == line[i]:
+            j += 1
+
+        length = j - i
+        # 3つ以上、かつ「無」以外ならマッチとみなす
+        if length >= 3 and line[i] in GEMS:
+            runs.append((i, length))
+
+        i = j
+    return runs
+
+# 盤面全体スキャン
+def scan_grid(grid: List[List[str]]) -> List[dict[str, int]]:
+    matches = []
+    rows = len(grid)
+    cols = len(grid[0])
+
+    # 横方向（行）を捜査
+    for y in range(rows):
+        runs = get_all_runs(grid[y])
+        for start_x, length in runs:
+            matches.append({
+                "type": "yoko",
+                "y": y,
+                "x": start_x,
+                "length": length
+            })
+
+    # 縦方向（列）を捜査
+    for x in range(cols):
+        col_list = [grid[y][x] for y in range(rows)]
+        runs = get_all_runs(col_list)
+        for start_y, length in runs:
+            matches.append({
+                "type": "tate",
+                "x": x,
+                "y": start_y,
+                "length": length
+            })
+
+    return matches
+
+# 鎌足
+def get_clusters(field: List[List[str]], matches: List[dict]) -> List[dict]:
+    matched_coords = set()
+    for m in matches:
+        if m["type"] == "yoko":
+            for k in range(m["x"], m["x"] + m["length"]):
+                matched_coords.add((k, m["y"]))
+        else: # tate
+            for k in range(m["y"], m["y"] + m["length"]):
+                matched_coords.add((m["x"], k))
+
+    clusters = []
+    visited = set()
+
+    for cx, cy in matched_coords:
+        if (cx, cy) in visited:
+            continue
+
+        color = field[cy][cx]
+        gem_group = []
+
+        stack = [(cx, cy)]
+        visited.add((cx, cy))
+
+        while stack:
+            curr_x, curr_y = stack.pop()
+            gem_group.append((curr_x, curr_y))
+
+            for dx, dy in [(1,0), (-1,0), (0,1), (0,-1)]:
+                nx, ny = curr_x + dx, curr_y + dy
+
+                if (nx, ny) in matched_coords and (nx, ny) not in visited:
+                    if field[ny][nx] == color:
+                        visited.add((nx, ny))
+                        stack.append((nx, ny))
+
+        clusters.append({
+            "color": color,
+            "count": len(gem_group),
+            "coords": gem_group
+        })
+
+    return clusters
+
+# ---------------- ビットボード ----------------
+# 盤面をGEMSの属性ごとに1つの整数で持つ。(x, y) のマスは bit (y * cols + x)
+# 「無」はどのビットボードにも立たない
+
+@lru_cache(maxsize=None)
+def board_masks(rows: int, cols: int) -> Tuple[int, int, int]:
+    # 左端以外 / 右端以外 / 横3連の始点になれるマス
+    not_left = not_right = h_start = 0
+    for y in range(rows):
+        for x in range(cols):
+            bit = 1 << (y * cols + x)
+            if x > 0:
+                not_left |= bit
+            if x < cols - 1:
+                not_right |= bit
+            if x <= cols - 3:
+                h_start |= bit
+    return not_left, not_right, h_start
+
+def to_bitboards(field: List[List[str]]) -> List[int]:
+    boards = [0] * len(GEMS)
+    bit = 1
+    for row in field:
+        for elem in row:
+            i = GEM_INDEX.get(elem)
+            if i is not None:
+                boards[i] |= bit
+            bit <<= 1
+    return boards
+
+def match_mask(b: int, rows: int, cols: int) -> int:
+    # シフトしてANDすると3連の始点だけが残る。始点から2つ分広げて消えるマスにする
+    _, _, h_start = board_masks(rows, cols)
+    h = b & (b >> 1) & (b >> 2) & h_start
+    v = b & (b >> cols) & (b >> (cols * 2))
+    return h | (h << 1) | (h << 2) | v | (v << cols) | (v << (cols * 2))
+
+def flood_fill(seed: int, region: int, rows: int, cols: int) -> int:
+    # seedから上下左右に、regionの中だけで広げられなくなるまで広げる
+    not_left, not_right, _ = board_masks(rows, cols)
+    while True:
+        grown = (seed | ((seed << 1) & not_left) | ((seed >> 1) & not_right)
+                 | (seed << cols) | (seed >> cols)) & region
+        if grown == seed:
+            return seed
+        seed = grown
+
+def bit_clusters(boards: List[int], rows: int, cols: int) -> List[Tuple[int, int]]:
+    # (GEMSのindex, 塊のマスク) のリスト
+    clusters = []
+    for i, b in enumerate(boards):
+        matched = match_mask(b, rows, cols)
+        while matched:
+            group = flood_fill(matched & -matched, matched, rows, cols)
+            clusters.append((i, group))
+            matched &= ~group
+    return clusters
+
+def mask_coords(mask: int, cols: int) -> List[Tuple[int, int]]:
+    coords = []
+    while mask:
+        low = mask & -mask
+        i = low.bit_length() - 1
+        coords.append((i % cols, i // cols))
+        mask ^= low
+    return coords
+
+# scan_grid + get_clusters と同じ形 (color, count, coords) で返す
+def find_clusters(field: List[List[str]]) -> List[dict]:
+    rows = len(field)
+    cols = len(field[0])
+    clusters = []
+    for i, group in bit_clusters(to_bitboards(field), rows, cols):
+        clusters.append({
+            "color": GEMS[i],
+            "count": group.bit_count(),
+            "coords": mask_coords(group, cols)
+        })
+    return clusters
+
+# ---------------- ドラッグ中のプレビュー ----------------
+# 行ごと・列ごとに「3つ以上並んでいるマス」のビットを覚えておき、入れ替えたら
+# その2行・2列だけ見直す。属性ごとの横/縦の合計は、行同士 (列同士) でビットが重ならないので
+# XOR で差し替えられる (横と縦は十字で重なるので別々に持つ)。
+# 塊も属性ごとにマスクのリストで持っておき、変わったマスとその隣にかかる塊だけ数え直す。
+# 1回の入れ替えで見るのは最大4本の線と、その線にかかる塊だけ (離れたところの塊は広げ直さない)。
+# 線の長さぶん (行数 + 列数) は大きい盤面ほどかかるが、マスの数 (行数 x 列数) には比例しない
+class MatchIndex:
+    def __init__(self, field: List[List[str]]):
+        self.field = field
+        self.rows = len(field)
+        self.cols = len(field[0])
+        # 行y / 列x ごとの (属性, 消えるマスのビット) と、属性ごとの合計
+        self.row_runs = [[] for _ in range(self.rows)]
+        self.col_runs = [[] for _ in range(self.cols)]
+        self.h_matched = [0] * len(GEMS)
+        self.v_matched = [0] * len(GEMS)
+        # 属性ごとの消えるマス (横 | 縦) と、それを塊に分けたマスクのリスト
+        self.matched = [0] * len(GEMS)
+        self.clusters = [[] for _ in GEMS]
+        # 今ここで離したら最初に消える塊の数とジェムの数 (連鎖は落ちてくるジェムしだいなので数えない)
+        self.combo = 0
+        self.cleared = 0
+        for y in range(self.rows):
+            self._rescan_row(y)
+        for x in range(self.cols):
+            self._rescan_col(x)
+        self._count()
+
+    @staticmethod
+    def _replace(total: list, old: list, new: list):
+        for i, bits in old:
+            total[i] ^= bits
+        for i, bits in new:
+            total[i] ^= bits
+
+    def _rescan_row(self, y: int):
+        line = self.field[y]
+        runs = []
+        for start, length in get_all_runs(line):
+            runs.append((GEM_INDEX[line[start]], ((1 << length) - 1) << (y * self.cols + start)))
+        self._replace(self.h_matched, self.row_runs[y], runs)
+        self.row_runs[y] = runs
+
+    def _rescan_col(self, x: int):
+        cols = self.cols
+        line = [row[x] for row in self.field]
+        runs = []
+        for start, length in get_all_runs(line):
+            bits = 0
+            for k in range(start, start + length):
+                bits |= 1 << (k * cols + x)
+            runs.append((GEM_INDEX[line[start]], bits))
+        self._replace(self.v_matched, self.col_runs[x], runs)
+        self.col_runs[x] = runs
+
+    def _recount(self, i: int):
+        old = self.matched[i]
+        new = self.h_matched[i] | self.v_matched[i]
+        if old == new:
+            return
+        rows, cols = self.rows, self.cols
+        not_left, not_right, _ = board_masks(rows, cols)
+        changed = old ^ new
+        near = changed | ((changed << 1) & not_left) | ((changed >> 1) & not_right) | (changed << cols) | (changed >> cols)
+        # 変わったマスにも、その隣にもかからない塊はそのまま (まわりが変わっていないので広がらない)
+        keep = []
+        seeds = new & changed
+        for group in self.clusters[i]:
+            if group & near:
+                seeds |= group & new
+            else:
+                keep.append(group)
+        while seeds:
+            group = flood_fill(seeds & -seeds, new, rows, cols)
+            keep.append(group)
+            seeds &= ~group
+        self.clusters[i] = keep
+        self.matched[i] = new
+
+    def _count(self):
+        for i in range(len(GEMS)):
+            self._recount(i)
+        self.combo = sum(map(len, self.clusters))
+        self.cleared = sum(b.bit_count() for b in self.matched)
+
+    def swap(self, a: Tuple[int, int], b: Tuple[int, int]):
+        # 盤面のマス a と b を入れ替えて、かかわる行と列だけ見直す
+        (ax, ay), (bx, by) = a, b
+        field = self.field
+        field[ay][ax], field[by][bx] = field[by][bx], field[ay][ax]
+        for y in {ay, by}:
+            self._rescan_row(y)
+        for x in {ax, bx}:
+            self._rescan_col(x)
+        self._count()
+
+# ---------------- ターン解決 (描画なし) ----------------
+def apply_gravity(field: List[List[str]], rng=random) -> Tuple[list, list]:
+    # 「無」を詰めて上から補充する。盤面はその場で書き換える
+    # moves: (x, 元のy, 落ちた先のy, elem)  spawns: (x, y, elem, その列で補充した数)
+    # 消えたマスのない列は何も動かないので moves にも入れない
+    # (大きい盤面では連鎖の後半ほど、触らない列が多くなる)
+    rows = len(field)
+    cols = len(field[0])
+    moves = []
+    spawns = []
+
+    for x in range(cols):
+        column = [row[x] for row in field]
+        if "無" not in column:
+            continue
+        old_gems = [(y, elem) for y, elem in enumerate(column) if elem != "無"]
+
+        missing_count = rows - len(old_gems)
+        new_gems_list = [rng.choice(GEMS) for _ in range(missing_count)]
+
+        write_y = rows - 1
+        for org_y, elem in reversed(old_gems):
+            moves.append((x, org_y, write_y, elem))
+            field[write_y][x] = elem
+            write_y -= 1
+
+        for elem in reversed(new_gems_list):
+            spawns.append((x, write_y, elem, missing_count))
+            field[write_y][x] = elem
+            write_y -= 1
+
+    return moves, spawns
+
+def resolve_turn(field: List[List[str]], rng=random) -> List[dict]:
+    # 盤面が止まるまで消して落とす。描画側はこのイベント列を順番に再生すればいい
+    events = []
+    combo = 0
+    to_do = {g: 0 for g in GEMS}
+
+    while True:
+        clusters = find_clusters(field)
+        if not clusters:
+            break
+
+        for cluster in clusters:
+            combo += 1
+            # 倍率バカすぎるかも
+            bonus = (cluster["count"] - 3) * 0.8
+            to_do[cluster["color"]] += 1.00 + bonus
+
+            for (gx, gy) in cluster["coords"]:
+                field[gy][gx] = "無"
+            events.append({"type": "clear", "combo": combo, **cluster})
+
+        moves, spawns = apply_gravity(field, rng)
+        events.append({"type": "fall", "moves": moves})
+        events.append({"type": "spawn", "gems": spawns})
+
+    events.append({"type": "combo", "combo": combo, "to_do": to_do})
+    return events
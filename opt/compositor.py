@@ -0,0 +1,91 @@
+import pygame as pg
+
+# ---------------- レイヤー合成 ----------------
+# 動かない背景(盤面のマスや枠)は1回だけ描いて、その上に透明なレイヤーを重ねる。
+# レイヤーの中身は「部品」単位で持っていて、部品の状態が変わったときだけ描き直す。
+# 描き直した場所だけを pg.display.update(rects) で画面に送る
+class Compositor:
+    def __init__(self, screen: pg.Surface, layer_names):
+        self.screen = screen
+        self.full = screen.get_rect()
+        self.background = pg.Surface(self.full.size).convert()
+        self.order = list(layer_names)
+        self.layers = {name: pg.Surface(self.full.size, pg.SRCALPHA).convert_alpha() for name in self.order}
+        # layer -> {key: (state, rect, draw)}
+        self.parts = {name: {} for name in self.order}
+        self.dirty = []
+        # 直前のフレームで画面に送ったピクセル数
+        self.pixels = 0
+
+    def set_background(self, draw):
+        draw(self.background)
+        self.invalidate()
+
+    def invalidate(self):
+        # 画面に直接描いたあとなどは、次のフレームで全部送り直す
+        self.dirty = [self.full]
+
+    def part(self, layer: str, key, state, draw):
+        # draw(surf) は描いた範囲のRectを返す。stateが前と同じなら何もしない
+        parts = self.parts[layer]
+        old = parts.get(key)
+        if old is not None and old[0] == state:
+            return
+
+        surf = self.layers[layer]
+        if old is not None:
+            del parts[key]
+            self._erase(layer, old[1])
+
+        rect = draw(surf) if draw is not None else None
+        if rect is None:
+            rect = pg.Rect(0, 0, 0, 0)
+        rect = rect.clip(self.full)
+        parts[key] = (state, rect, draw)
+        if rect.w and rect.h:
+            self.dirty.append(rect)
+
+    def clear(self, layer: str, key):
+        old = self.parts[layer].pop(key, None)
+        if old is not None:
+            self._erase(layer, old[1])
+
+    def _erase(self, layer: str, area: pg.Rect):
+        if not (area.w and area.h):
+            return
+        surf = self.layers[layer]
+        surf.fill((0, 0, 0, 0), area)
+        # 消した範囲にかかっていた同じレイヤーの他の部品を描き直す
+        surf.set_clip(area)
+        for state, rect, draw in self.parts[layer].values():
+            if draw is not None and rect.colliderect(area):
+                draw(surf)
+        surf.set_clip(None)
+        self.dirty.append(area)
+
+    def present(self) -> int:
+        rects = merge_rects(self.dirty)
+        self.dirty = []
+        for r in rects:
+            self.screen.blit(self.background, r, r)
+            for name in self.order:
+                self.screen.blit(self.layers[name], r, r)
+        if rects:
+            pg.display.update(rects)
+        self.pixels = sum(r.w * r.h for r in rects)
+        return self.pixels
+
+def merge_rects(rects: list) -> list:
+    # 重なっている矩形はまとめて、同じピクセルを2回送らないようにする
+    merged = []
+    for r in rects:
+        r = pg.Rect(r)
+        i = 0
+        while i < len(merged):
+            if merged[i].colliderect(r):
+                r.union_ip(merged.pop(i))
+                i = 0
+            else:
+                i += 1
+        merged.append(r)
+    return merged
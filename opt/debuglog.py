@@ -0,0 +1,144 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+# ---------------- デバッグ用のログ ----------------
+# print の代わり。カテゴリ (rules / input / ui / save など) ごとにレベルを決めて、それより低いものは何もしない。
+#   log = debuglog.get("rules")
+#   log.debug("elem: %s buffs: %s", elem, buffs)   出さないときは % で文字列を作らない
+#   if log.debug_on: ...                            引数を用意するのも重いときは先に見る
+# 文字列を作るのは呼んだスレッド (その時点の値を残すため)、書き出すのは裏の1本のスレッド。
+# ゲームのスレッドはキューに入れるだけなので、遅い端末やパイプに書いていても止まらない
+# レベルは "warn" や "rules=debug,input=info" のように書く (カテゴリを書かないものは全体の既定)。
+# 環境変数 PAZMON_LOG か、pazmon.py / simulate.py / server.py の --log-level で決める。省略すると warn
+DEBUG, INFO, WARN, ERROR, OFF = 10, 20, 30, 40, 100
+LEVEL_NAMES = {"debug": DEBUG, "info": INFO, "warn": WARN, "error": ERROR, "off": OFF}
+_LABELS = {DEBUG: "DEBUG", INFO: "INFO", WARN: "WARN", ERROR: "ERROR"}
+ENV = "PAZMON_LOG"
+# 裏のスレッドがまとめて書き出す間隔 (秒)
+FLUSH_INTERVAL = 0.05
+
+def parse_levels(text: str) -> dict:
+    # "rules=debug,warn" -> {"rules": DEBUG, None: WARN}。None が全体の既定
+    levels = {}
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        category, _, name = item.rpartition("=")
+        if name.lower() not in LEVEL_NAMES:
+            raise ValueError(f"ログのレベルは {'/'.join(LEVEL_NAMES)} のどれかです: {item!r}")
+        levels[category or None] = LEVEL_NAMES[name.lower()]
+    return levels
+
+class Logger:
+    __slots__ = ("category", "level", "debug_on")
+
+    def __init__(self, category: str, level: int):
+        self.category = category
+        self.set_level(level)
+
+    def set_level(self, level: int):
+        self.level = level
+        self.debug_on = level <= DEBUG
+
+    def debug(self, msg: str, *args):
+        if self.level <= DEBUG:
+            _writer.put(self.category, DEBUG, msg, args)
+
+    def info(self, msg: str, *args):
+        if self.level <= INFO:
+            _writer.put(self.category, INFO, msg, args)
+
+    def warn(self, msg: str, *args):
+        if self.level <= WARN:
+            _writer.put(self.category, WARN, msg, args)
+
+    def error(self, msg: str, *args):
+        if self.level <= ERROR:
+            _writer.put(self.category, ERROR, msg, args)
+
+class _Writer:
+    def __init__(self):
+        self.stream = None
+        self._lines = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._start = time.perf_counter()
+
+    def put(self, category: str, level: int, msg: str, args: tuple):
+        text = msg % args if args else msg
+        self._lines.append(f"{time.perf_counter() - self._start:9.3f} {_LABELS[level]:<5} {category}: {text}\n")
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="debuglog", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        # 溜まっている行を1回の write で書く。終了時には呼んだスレッドで残りを書く
+        with self._lock:
+            lines = self._lines
+            chunk = []
+            while lines:
+                chunk.append(lines.popleft())
+            if not chunk:
+                return
+            stream = self.stream or sys.stderr
+            try:
+                stream.write("".join(chunk))
+                stream.flush()
+            except (OSError, ValueError):
+                # 閉じた端末やパイプに書けなくても、ゲームは止めない
+                pass
+
+    def after_fork(self):
+        # fork した子プロセスには裏のスレッドが無いので、次に書くときに作り直す
+        self._lock = threading.Lock()
+        self._lines.clear()
+        self._thread = None
+
+_writer = _Writer()
+_loggers = {}
+_levels = {None: WARN}
+
+def get(category: str) -> Logger:
+    log = _loggers.get(category)
+    if log is None:
+        log = _loggers[category] = Logger(category, _levels.get(category, _levels[None]))
+    return log
+
+def configure(levels, stream=None):
+    # levels は parse_levels() の結果か、その文字列。stream を省略すると標準エラー出力
+    global _levels
+    if isinstance(levels, str):
+        levels = parse_levels(levels)
+    _levels = {None: WARN} | levels
+    _writer.stream = stream
+    for category, log in _loggers.items():
+        log.set_level(_levels.get(category, _levels[None]))
+
+def flush():
+    _writer.flush()
+
+atexit.register(flush)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_writer.after_fork)
+
+def _configure_from_env():
+    # 環境変数の書き間違いで、import したもの全部 (ゲーム・シミュレーター・サーバー) が止まらないようにする。
+    # --log-level で渡したものは parse_levels() の ValueError のまま
+    text = os.environ.get(ENV, "warn")
+    try:
+        configure(text)
+    except ValueError as e:
+        configure("warn")
+        sys.stderr.write(f"{ENV} を読めないので warn にします: {e}\n")
+
+_configure_from_env()
@@ -0,0 +1,63 @@
+from collections import deque
+from typing import Iterator
+
+# ---------------- 固定ステップ ----------------
+# ゲームの中身 (入力・ドラッグの制限時間・タイムライン) は 1/120 秒ずつ進め、描画はそのあとに1回だけ。
+# 描画が遅いフレームでは何ステップかまとめて進めてから描く (間引かれるのは描画のほう)。
+# 入力はポーリングした時に時刻を付けて貯めておき、その時刻を含むステップで処理する。
+# pygame のイベントには時刻が無いので、「前にポーリングしたときより後に来た」ことだけ分かる。
+# その一番早い時刻を付けておけば、重いフレームのあいだに離した指が制限時間より後に回されることはない
+LOGIC_HZ = 120
+# 1フレームでこれ以上止まったぶんは捨てる (追いつこうとして、もっと遅くなるのを防ぐ)
+MAX_FRAME = 0.25
+_EPS = 1e-9
+
+class FixedStep:
+    def __init__(self, hz: int = LOGIC_HZ, max_frame: float = MAX_FRAME):
+        self.dt = 1 / hz
+        self.max_frame = max_frame
+        # 進めたステップの数。ゲームの時計は ticks * dt
+        self.ticks = 0
+        # 捨てた時間の合計
+        self.dropped = 0.0
+        self._acc = 0.0
+        self._last_poll = 0.0
+        self._inbox = deque()
+
+    @property
+    def now(self) -> float:
+        # 最後に進めたステップの終わりの時刻
+        return self.ticks * self.dt
+
+    def clock(self) -> float:
+        # まだ進めていない時間も入れた、実時間に合わせた時刻
+        return self.now + self._acc
+
+    def alpha(self) -> float:
+        # 最後のステップから次のステップまでのどこにいるか (0.0〜1.0)。描画の補間に使う
+        return min(1.0, self._acc / self.dt)
+
+    def advance(self, elapsed: float):
+        # 前のフレームからの実時間を足す
+        if elapsed > self.max_frame:
+            self.dropped += elapsed - self.max_frame
+            elapsed = self.max_frame
+        self._acc += elapsed
+
+    def post(self, events: list):
+        t = self._last_poll
+        self._last_poll = self.clock()
+        for e in events:
+            self._inbox.append((t, e))
+
+    def steps(self) -> Iterator[list]:
+        # 貯まった時間のぶんだけ1ステップずつ進める。ステップごとに、そこまでに来た入力を返す
+        inbox = self._inbox
+        while self._acc >= self.dt - _EPS:
+            self._acc = max(0.0, self._acc - self.dt)
+            self.ticks += 1
+            end = self.now + _EPS
+            due = []
+            while inbox and inbox[0][0] <= end:
+                due.append(inbox.popleft()[1])
+            yield due
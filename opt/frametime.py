@@ -0,0 +1,80 @@
+import csv
+import os
+import time
+
+# ---------------- フレーム時間の計測 ----------------
+# 1フレームを区間に分けて、それぞれにかかった時間を覚えておく。
+# カクつくときに、描画・ゲームの処理・画面への転送のどれが重いのかを見る用
+#   events   : イベントの受け取りと処理 (ドラッグ・クリック)。固定ステップの中で処理したぶんも足す
+#   hit_test : パーティのボタンの当たり判定を作るところ
+#   logic    : 固定ステップのうち入力の処理以外 (ドラッグの制限時間、連鎖とダメージの計算、タイムラインの更新、スキル)
+#   draw     : 部品の描き直し
+#   fall     : 落下アニメーションの1コマ
+#   present  : 画面への転送 (pg.display.update)
+#   wait     : clock.tick(60) で待っていた時間
+PHASES = ("events", "hit_test", "logic", "draw", "fall", "present", "wait")
+
+class FrameTimer:
+    def __init__(self, size: int = 600):
+        # 直近 size フレームだけ持つリングバッファ
+        self.size = size
+        self.rows = [[0.0] * len(PHASES) for _ in range(size)]
+        self.count = 0
+        self._index = {name: i for i, name in enumerate(PHASES)}
+        self._cur = [0.0] * len(PHASES)
+        self._last = time.perf_counter()
+
+    def lap(self, phase: str):
+        # 前回 lap した時刻からここまでを phase の時間にする(同じフレームで何回呼んでも足される)
+        now = time.perf_counter()
+        self._cur[self._index[phase]] += now - self._last
+        self._last = now
+
+    def next_frame(self):
+        self.rows[self.count % self.size] = self._cur
+        self.count += 1
+        self._cur = [0.0] * len(PHASES)
+        self._last = time.perf_counter()
+
+    def recent(self) -> list:
+        # 古い順に並べたフレーム (秒)
+        if self.count < self.size:
+            return self.rows[:self.count]
+        i = self.count % self.size
+        return self.rows[i:] + self.rows[:i]
+
+    def stats(self) -> dict:
+        # phase -> (p50, p95, p99) ミリ秒。"frame" は1フレーム全体
+        rows = self.recent()
+        if not rows:
+            return {}
+        result = {}
+        for i, name in enumerate(PHASES):
+            result[name] = percentiles([r[i] for r in rows])
+        result["frame"] = percentiles([sum(r) for r in rows])
+        return result
+
+    def dump_csv(self, path: str) -> str:
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        start = self.count - len(self.recent())
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["frame"] + [f"{name}_ms" for name in PHASES] + ["total_ms"])
+            for n, r in enumerate(self.recent()):
+                w.writerow([start + n] + [f"{v * 1000:.3f}" for v in r] + [f"{sum(r) * 1000:.3f}"])
+        return path
+
+def percentiles(values: list) -> tuple:
+    s = sorted(values)
+    n = len(s)
+    return tuple(s[min(n - 1, int(p / 100 * n))] * 1000 for p in (50, 95, 99))
+
+def hud_lines(stats: dict) -> list:
+    lines = ["ms        p50   p95   p99"]
+    for name in PHASES + ("frame",):
+        if name in stats:
+            p50, p95, p99 = stats[name]
+            lines.append(f"{name:<8}{p50:6.2f}{p95:6.2f}{p99:6.2f}")
+    return lines
@@ -1,92 +1,149 @@
 import pygame as pg
-import sys, os, random, time
-from typing import List, Tuple, Optional
+import sys, os, time, json, threading
+from typing import Optional
 import math
-
-from pygame.draw import rect
-
-pg.init()
+from functools import lru_cache
+
+from board import BOARD_ROWS, BOARD_COLS, parse_size, resolve_turn, MatchIndex
+from record import RngStreams, log_turn, encode_log, parse_seed
+from rules import (time_limit, partylist, new_game, activate_skill, party_turn, enemy_turn, end_turn,
+                   solver_weights)
+from compositor import Compositor
+from timeline import Timeline
+from frametime import FrameTimer, hud_lines
+from fixedstep import FixedStep
+from solver import solve, new_pool, HINT, BOT
+from assets import AssetManager
+from savegame import Autosaver, read_game
+import debuglog
+
+log_ui = debuglog.get("ui")
+log_input = debuglog.get("input")
 
 # ---------------- フォント解決 ----------------
-def get_jp_font(size: int) -> pg.font.Font:
+# match_font はシステムのフォントを全部見に行くので遅い。
+# 見つけたパスはディスクに覚えておき、フォントのフォルダが変わっていなければそれを使う
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "pazmon")
+FONT_INDEX = os.path.join(CACHE_DIR, "font_index.json")
+FONT_DIRS = [
+    "/usr/share/fonts", "/usr/local/share/fonts",
+    os.path.join(os.path.expanduser("~"), ".fonts"),
+    os.path.join(os.path.expanduser("~"), ".local", "share", "fonts"),
+    "/Library/Fonts", "/System/Library/Fonts",
+    os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+]
+FONT_CANDIDATES = [
+    "Noto Sans CJK JP", "Noto Sans JP",
+    "Yu Gothic UI", "Yu Gothic",
+    "Meiryo", "MS Gothic",
+    "Hiragino Sans", "Hiragino Kaku Gothic ProN",
+]
+
+_font_cache: dict = {}
+_font_path: Optional[str] = None
+_font_resolved = False
+
+def font_dirs_stamp() -> list:
+    # フォルダの数と一番新しい更新時刻。フォントを入れたり消したりすると変わる
+    count = 0
+    newest = 0
+    for d in FONT_DIRS:
+        for root, dirs, files in os.walk(d):
+            count += 1
+            newest = max(newest, os.stat(root).st_mtime_ns)
+    return [count, newest]
+
+def resolve_jp_font_path() -> Optional[str]:
     bundle = os.path.join("assets", "fonts", "NotoSansJP-VariableFont_wght.ttf")
     if os.path.exists(bundle):
-        return pg.font.Font(bundle, size)
-    candidates = [
-        "Noto Sans CJK JP", "Noto Sans JP",
-        "Yu Gothic UI", "Yu Gothic",
-        "Meiryo", "MS Gothic",
-        "Hiragino Sans", "Hiragino Kaku Gothic ProN",
-    ]
-    for name in candidates:
+        return bundle
+
+    stamp = font_dirs_stamp()
+    try:
+        with open(FONT_INDEX, encoding="utf-8") as f:
+            index = json.load(f)
+        path = index["path"]
+        if index["stamp"] == stamp and (path is None or os.path.exists(path)):
+            return path
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    path = None
+    for name in FONT_CANDIDATES:
         path = pg.font.match_font(name)
         if path:
-            return pg.font.Font(path, size)
-    return pg.font.SysFont(None, size)
-
-# ---------------- パラメータ(可変ではなくなったぜ) ----------------
-FRAME_DELAY = 0.5
-ENEMY_DELAY = 1.0
+            break
 
-time_limit = 12.0
-partylist = [
-    {"name":"青龍","element":"風","hp":150,"max_hp":150,"ap":15,"dp":10,"skills":"竜巻"},
-    {"name":"朱雀","element":"火","hp":150,"max_hp":150,"ap":25,"dp":10,"skills":"火を纏う"},
-    {"name":"白虎","element":"土","hp":150,"max_hp":150,"ap":20,"dp":5,"skills":"引っ掻く"},
-    {"name":"玄武","element":"水","hp":150,"max_hp":150,"ap":20,"dp":15,"skills":"鉄壁"},
-    {"name":"青龍","element":"風","hp":150,"max_hp":150,"ap":15,"dp":10,"skills":"竜巻"},
-    {"name":"朱雀","element":"火","hp":150,"max_hp":150,"ap":25,"dp":10,"skills":"火を纏う"},
-]
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(FONT_INDEX, "w", encoding="utf-8") as f:
+            json.dump({"stamp": stamp, "path": path}, f)
+    except OSError:
+        pass
+    return path
 
-# もしかしたら、elemを配列として渡した方が後々幸せかも(やらんけど) <- ごめん何言ってんの
-SKILLS = {
-    "竜巻": {
-        "effect": "5ターンの間、風属性のダメージ5倍",
-        "ct": 5,
-        "buff" : {
-            "num": 5, "elem": "風", "turn": 5
-        }
-    },
-    "火を纏う": {
-        "effect": "火・命ジェムをランダムに合計10個生成",
-        "ct": 3,
-        "makegem": {
-            # ごめんここか
-            "make": 10, "elem": ["火", "命"]
-        }
-    },
-    "引っ掻く": {
-        "effect": "相手の場のモンスターに最大hp50%ダメージ",
-        "ct": 7,
-        "attack" : {
-            # 0.5 -> 50%
-            "num": 0.5
-        }
-    },
-    "鉄壁": {
-        "effect": "1ターンの間、ダメージ90%カット(重複しない)",
-        "ct": 4,
-        "defence" : {
-            "num": 0.9,
-        }
-    },
-}
+def get_jp_font(size: int) -> pg.font.Font:
+    global _font_path, _font_resolved
+    f = _font_cache.get(size)
+    if f is not None:
+        return f
 
-info = pg.display.Info()
-screen_w = info.current_w
-screen_h = info.current_h
-WIN_H = screen_h * 0.92
-WIN_W = int(WIN_H * 9/16)
+    if not _font_resolved:
+        _font_path = resolve_jp_font_path()
+        _font_resolved = True
 
-os.environ['SDL_VIDEO_CENTERED'] = '1'
+    if _font_path:
+        f = pg.font.Font(_font_path, size)
+    else:
+        # 日本語フォントが無いときは pygame の既定のフォント。SysFont(None) と同じものだが、
+        # SysFont は毎回システムのフォントを全部見に行く (initsysfonts) ので、Font(None) で直接開く
+        f = pg.font.Font(None, size)
+    _font_cache[size] = f
+    return f
 
-usable_width = WIN_W * 0.90
+# ---------------- パラメータ(可変ではなくなったぜ) ----------------
+FRAME_DELAY = 0.5
+ENEMY_DELAY = 1.0
 
-FIELD_Y = int(WIN_H * 0.55)
+# ---------------- 画面 ----------------
+# 大きさは画面の解像度で決まるので、import したときではなく open_window() で決める
+# (pg.display.Info() はディスプレイを初期化しないと使えない)
+# 盤面のマス (SLOT_*) は盤面の列数・行数で、パーティの枠 (MEMBER_*) はパーティの人数で決める
+WIN_W = WIN_H = 0
+FIELD_Y = SLOT_W = LEFT_MARGIN = 0
 SLOT_PAD = 8
-SLOT_W = int((usable_width - (SLOT_PAD * (6 - 1))) / 6)
-puzzle_total_width = (SLOT_W * 6) + (SLOT_PAD * (6 - 1))
-LEFT_MARGIN = (WIN_W - puzzle_total_width) // 2
+MEMBER_W = MEMBER_LEFT = 0
+MEMBER_PAD = 8
+
+def set_layout(screen_h, rows=BOARD_ROWS, cols=BOARD_COLS, members=len(partylist)):
+    global WIN_W, WIN_H, FIELD_Y, SLOT_W, SLOT_PAD, LEFT_MARGIN, MEMBER_W, MEMBER_LEFT
+    WIN_H = screen_h * 0.92
+    WIN_W = int(WIN_H * 9/16)
+
+    usable_width = WIN_W * 0.90
+
+    MEMBER_W = int((usable_width - (MEMBER_PAD * (members - 1))) / members)
+    MEMBER_LEFT = (WIN_W - (MEMBER_W * members + MEMBER_PAD * (members - 1))) // 2
+
+    # 列が多いときはすき間も狭くする (6列で8px)
+    FIELD_Y = int(WIN_H * 0.55)
+    SLOT_PAD = max(2, 48 // cols)
+    usable_height = WIN_H * 0.43
+    SLOT_W = int(min((usable_width - (SLOT_PAD * (cols - 1))) / cols,
+                     (usable_height - (SLOT_PAD * (rows - 1))) / rows))
+    puzzle_total_width = (SLOT_W * cols) + (SLOT_PAD * (cols - 1))
+    LEFT_MARGIN = (WIN_W - puzzle_total_width) // 2
+
+def open_window(rows=BOARD_ROWS, cols=BOARD_COLS) -> pg.Surface:
+    # 使うのは画面とフォントだけ。pg.init() だと音(mixer)なども全部立ち上がる
+    os.environ['SDL_VIDEO_CENTERED'] = '1'
+    pg.display.init()
+    pg.font.init()
+    set_layout(pg.display.Info().current_h, rows, cols)
+    # kakudai hyouji
+    screen = pg.display.set_mode((WIN_W, WIN_H))
+    pg.display.set_caption("Puzzle & Monsters - GUI Prototype")
+    return screen
 
 # ドラッグ演出
 DRAG_SCALE = 1.18
@@ -98,330 +155,161 @@ COLOR_RGB = {
     "火": (230, 70, 70), "水": (70, 150, 230), "風": (90, 200, 120),
     "土": (200, 150, 80), "命": (220, 90, 200), "無": (160,160,160)
 }
-GEMS = ["火", "水", "風", "土", "命"]
-SLOTS = [chr(ord('A')+i) for i in range(14)]
 
 # ---------------- 画像 ----------------
-def load_monster_image(name: str) -> pg.Surface:
-    m = {
-        "スライム":"slime.png", "ゴブリン":"goblin.png",
-        "オオコウモリ":"bat.png", "ウェアウルフ":"werewolf.png",
-        "ドラゴン":"dragon.png", 
-        "青龍":"seiryu.png", "朱雀":"suzaku.png", 
-        "白虎":"byakko.png", "玄武":"genbu.png"
-    }
-    fn = m.get(name)
-    if fn:
-        path = os.path.join("assets","monsters",fn)
-        if os.path.exists(path):
-            img = pg.image.load(path).convert_alpha()
-            return pg.transform.smoothscale(img, (256,256))
-    surf = pg.Surface((256,256), pg.SRCALPHA); surf.fill((60,60,60,200))
-    return surf
-
 # ---------------- HPバー ----------------
-def hp_bar_surf(current: int, max_hp: int, w: int, h: int) -> pg.Surface:
+# HPバーと数字は中身が同じなら同じSurfaceを使い回す(HPが変わったときだけ作る)
+def hp_bar_style(current: int, max_hp: int, w: int) -> tuple[int, tuple]:
     ratio = max(0, min(1, current / max_hp if max_hp > 0 else 0))
-    bar_w = w
-    fill_w = int(bar_w * ratio)
+    fill_w = int(w * ratio)
 
     if ratio >= 0.6: col = (40, 200, 90)
     elif ratio >= 0.3: col = (230, 200, 60)
     else: col = (230, 70, 70)
+    return fill_w, col
 
+@lru_cache(maxsize=64)
+def _hp_bar(fill_w: int, col: tuple, w: int, h: int) -> pg.Surface:
     surf = pg.Surface((w, h), pg.SRCALPHA)
-    bg = pg.Surface((bar_w, h), pg.SRCALPHA)
-    bg.fill((0, 0, 0, 120))
-    surf.blit(bg, (0, 0))
-    fg = pg.Surface((fill_w, h), pg.SRCALPHA)
-    fg.fill(col)
-    surf.blit(fg, (0, 0))
+    surf.fill((0, 0, 0, 120))
+    surf.fill(col, (0, 0, fill_w, h))
     return surf
 
-# ---------------- 盤面ロジック ----------------
-def init_field()->List[List[str]]:
-    return [[random.choice(GEMS) for i in range(6)] for j in range(5)]
-
-def get_all_runs(line: List[str]) -> List[Tuple[int, int]]:
-    runs = []
-    n = len(line)
-    i = 0
-    while i < n:
-        j = i + 1
-        while j < n and line[j] == line[i]:
-            j += 1
-        
-        length = j - i
-        # 3つ以上、かつ「無」以外ならマッチとみなす
-        if length >= 3 and line[i] in GEMS:
-            runs.append((i, length))
-        
-        i = j
-    return runs
-
-# 盤面全体スキャン
-def scan_grid(grid: List[List[str]]) -> List[dict[str, int]]:
-    matches = []
-    rows = len(grid)
-    cols = len(grid[0])
-
-    # 横方向（行）を捜査
-    for y in range(rows):
-        runs = get_all_runs(grid[y])
-        for start_x, length in runs:
-            matches.append({
-                "type": "yoko",
-                "y": y,
-                "x": start_x,
-                "length": length
-            })
-
-    # 縦方向（列）を捜査
-    for x in range(cols):
-        col_list = [grid[y][x] for y in range(rows)]
-        runs = get_all_runs(col_list)
-        for start_y, length in runs:
-            matches.append({
-                "type": "tate",
-                "x": x,
-                "y": start_y,
-                "length": length
-            })
-
-    return matches
-
-# 鎌足
-def get_clusters(field: List[List[str]], matches: List[dict]) -> List[dict]:
-    matched_coords = set()
-    for m in matches:
-        if m["type"] == "yoko":
-            for k in range(m["x"], m["x"] + m["length"]):
-                matched_coords.add((k, m["y"]))
-        else: # tate
-            for k in range(m["y"], m["y"] + m["length"]):
-                matched_coords.add((m["x"], k))
-
-    clusters = []
-    visited = set()
-
-    for cx, cy in matched_coords:
-        if (cx, cy) in visited:
-            continue
-
-        color = field[cy][cx]
-        gem_group = []
-        
-        stack = [(cx, cy)]
-        visited.add((cx, cy))
-
-        while stack:
-            curr_x, curr_y = stack.pop()
-            gem_group.append((curr_x, curr_y))
-
-            for dx, dy in [(1,0), (-1,0), (0,1), (0,-1)]:
-                nx, ny = curr_x + dx, curr_y + dy
-                
-                if (nx, ny) in matched_coords and (nx, ny) not in visited:
-                    if field[ny][nx] == color:
-                        visited.add((nx, ny))
-                        stack.append((nx, ny))
-
-        clusters.append({
-            "color": color,
-            "count": len(gem_group),
-            "coords": gem_group
-        })
-
-    return clusters
-
-def animation_fall(screen, field, font, sukill_turn, party, enemy):
-    rows = len(field)
-    cols = len(field[0])
-    
-    # --- どこからどこへ動くかを計算する ---
-    moves = []
-    
-    for x in range(cols):
-        old_gems = []
-        for y in range(rows):
-            if field[y][x] != "無":
-                old_gems.append({
-                    "elem": field[y][x],
-                    "original_y": y
-                })
-        
-        missing_count = rows - len(old_gems)
-        new_gems_list = [random.choice(GEMS) for _ in range(missing_count)]
-        
-        write_y = rows - 1
-        
-        for item in reversed(old_gems):
-            elem = item["elem"]
-            org_y = item["original_y"]
-            dest_y = write_y
-            
-            # 座標計算
-            px = LEFT_MARGIN + x * (SLOT_W + SLOT_PAD)
-            start_px = FIELD_Y + org_y * (SLOT_W + SLOT_PAD)
-            end_px   = FIELD_Y + dest_y * (SLOT_W + SLOT_PAD)
-            
-            moves.append({
-                "elem": elem, "x": px,
-                "start_y": start_px, "end_y": end_px
-            })
-            
-            field[dest_y][x] = elem
-            write_y -= 1
-            
-        for i, elem in enumerate(reversed(new_gems_list)):
-            dest_y = write_y
-            
-            px = LEFT_MARGIN + x * (SLOT_W + SLOT_PAD)
-            end_px   = FIELD_Y + dest_y * (SLOT_W + SLOT_PAD)
-            start_px = FIELD_Y + (dest_y - missing_count - 1) * (SLOT_W + SLOT_PAD) - 20
-            
-            moves.append({
-                "elem": elem, "x": px,
-                "start_y": start_px, "end_y": end_px
-            })
-            
-            field[dest_y][x] = elem
-            write_y -= 1
-
-    # --- アニメーションループ ---
-    duration = 0.45
-    start_time = time.time()
-    
-    while True:
-        now = time.time()
-        progress = (now - start_time) / duration
-        if progress > 1.0: progress = 1.0
-        
-        t = progress * progress
-        
-        pg.event.pump() # フリーズ防止
-        
-        screen.fill((22, 22, 28))
-        draw_top(screen, enemy, party, font, sukill_turn )
-
-
-        for y in range(rows):
-            for x in range(cols):
-                rect_x = LEFT_MARGIN + x * (SLOT_W + SLOT_PAD)
-                rect_y = FIELD_Y + y * (SLOT_W + SLOT_PAD)
-                pg.draw.rect(screen, (35, 35, 40), (rect_x, rect_y, SLOT_W, SLOT_W), border_radius=8)
-
-        for m in moves:
-            current_y = m["start_y"] + (m["end_y"] - m["start_y"]) * t
-            draw_gem_at(screen, m["elem"], int(m["x"] + SLOT_W//2), int(current_y + SLOT_W//2), font=font)
-
-        draw_message(screen, "落下中...", font)
-        pg.display.flip()
-
-        if progress >= 1.0:
-            time.sleep(0.5)
-            break
-
-        # ここに遅延入れるとぬるぬるしすぎなくなる
-
-
-
-# ---------------- ダメージ/回復 ----------------
-def jitter(v:float, r:float=0.10)->int:
-    return max(1, int(v*random.uniform(1-r,1+r)))
-
-def attr_coeff(att,defe):
-    cyc={"火":"風","風":"土","土":"水","水":"火"}
-    if att in cyc and cyc[att]==defe: return 2.0
-    if defe in cyc and cyc[defe]==att: return 0.5
-    return 1.0
-
-def party_attack_from_gems(elem:str, run_len:int, combo:int, party:dict, monster:dict, buffs)->int:
-    combo_coeff = 1.5 ** ((run_len - 3) + combo)
-    if elem=="命":
-        heal=jitter(20*combo_coeff); party["hp"]=min(party["max_hp"], party["hp"]+heal); return 0
-    ally = next((a for a in party["allies"] if a["element"]==elem), None)
-    if not ally: return 0
-    base=max(1, ally["ap"] -monster["dp"])
-    print(f"elem: {elem} buffs: {buffs}")
-    dmg=jitter(base*attr_coeff(elem,monster["element"])*combo_coeff)*buffs
-    monster["hp"]=max(0,monster["hp"]-dmg); return dmg
-
-def enemy_attack(party:dict, monster:dict, def_cut)->int:
-    base=max(1, monster["ap"]-party["dp"])
-    dmg=round(jitter(base)*(1 - def_cut)); party["hp"]=max(0,party["hp"]-dmg); return dmg
-
-# ---------------- 描画ユーティリティ ----------------
-def slot_rect(i: int) -> pg.Rect:
-    tx = LEFT_MARGIN + i * (SLOT_W + SLOT_PAD)
-    return pg.Rect(tx, FIELD_Y, SLOT_W, SLOT_W)
-
-def draw_gem_at(screen, elem: str, x: int, y: int, scale=1.0, with_shadow=False, font=None):
-    r = int((SLOT_W//2 - 10) * scale)
-    if with_shadow:
-        shadow = pg.Surface((r*2+6, r*2+6), pg.SRCALPHA)
-        pg.draw.circle(shadow, DRAG_SHADOW, (r+3, r+3), r+3)
-        screen.blit(shadow, (x-r-3, y-r-3))
-    
-    color = COLOR_RGB[elem]
-    pg.draw.circle(screen, color, (x, y), r)
-    sym = ELEMENT_SYMBOLS[elem]
-    f = font if font else get_jp_font(int(26*scale))
-    s = f.render(sym, True, (0,0,0))
-    screen.blit(s, (x - s.get_width()//2, y - s.get_height()//2))
-
-def draw_field(screen, field: list[list[str]], font, animation_list,
-               hover_pos: Optional[tuple[int, int]] = None,
-               drag_src: Optional[tuple[int, int]] = None, 
-               drag_elem: Optional[str] = None):
-
-    rows = len(field)
-    cols = len(field[0])
-
-
-    for y in range(rows):
-        for x in range(cols):
-            elem = field[y][x]
-            rect_x = LEFT_MARGIN + x * (SLOT_W + SLOT_PAD)
-            rect_y = FIELD_Y + y * (SLOT_W + SLOT_PAD)
-            rect = pg.Rect(rect_x, rect_y, SLOT_W, SLOT_W)
-
-            scale = 1.0
-
-            for anim in animation_list:
-                if anim["x"] == x and anim["y"] == y:
-                    now = time.time()
-                    elapsed = now - anim["start_time"]
-                    progress = elapsed / anim["duration"]
-
-                    if 0 <= progress <= 1.0:
-                        # sin(0) -> 0, sin(π/2) -> 1, sin(π) -> 0
-                        # これで 1.0 -> 1.5 -> 1.0 という動きになる(choi kaeta kara uso tsuteru)
-                        wave = math.sin(progress * math.pi)
-                        scale = 1.0 + (0.6 * wave) 
-                    break
-
-            is_hover = (hover_pos == (x, y))
-            base_color = (60, 60, 80) if is_hover else (35, 35, 40)
-            pg.draw.rect(screen, base_color, rect, border_radius=8)
-
-            if drag_src == (x, y):
-                continue
+@lru_cache(maxsize=64)
+def _hp_panel(fill_w: int, col: tuple, text: str, w: int, h: int, font) -> tuple[pg.Surface, tuple]:
+    # バー + 右上の数字(影つき)。返り値は (Surface, バーの左上から見た位置)
+    t_surf = font.render(text, True, (255, 255, 255))
+    shadow = font.render(text, True, (0, 0, 0))
+    tw, th = t_surf.get_size()
 
-            if elem and elem != "無": 
-                cx, cy = rect.center
-                color = COLOR_RGB.get(elem, (100, 100, 100)) 
-                pg.draw.circle(screen, color, (cx, cy), SLOT_W // 2 - 10)
-                
-                sym = ELEMENT_SYMBOLS.get(elem, "?")
-                s = font.render(sym, True, (0, 0, 0))
-                screen.blit(s, (cx - s.get_width() // 2, cy - s.get_height() // 2))
+    # 右寄せ計算
+    text_x = w - tw
+    text_y = -10
 
-                draw_gem_at(screen, elem, cx, cy, scale=scale, font=font)
+    left = min(0, text_x)
+    top = text_y
+    right = max(w, text_x + tw + 1)
+    bottom = max(h, text_y + th + 1)
 
-    if drag_elem is not None:
-        mx, my = pg.mouse.get_pos()
-        draw_gem_at(screen, drag_elem, mx, my - 4, scale=DRAG_SCALE, with_shadow=True, font=font)
+    surf = pg.Surface((right - left, bottom - top), pg.SRCALPHA)
+    surf.blit(_hp_bar(fill_w, col, w, h), (-left, -top))
+    # 文字が見えやすいように少し影をつける（オプション）
+    surf.blit(shadow, (text_x + 1 - left, text_y + 1 - top))
+    surf.blit(t_surf, (text_x - left, text_y - top))
+    return surf, (left, top)
+
+# ---------------- アニメーション ----------------
+# 時間は timeline.py で進める。ここではtweenの値から位置や大きさを決めるだけ
+CLEAR_TIME = 0.4
+POP_TIME = 0.25
+FALL_TIME = 0.45
+FALL_HOLD = 0.5
+
+def fall_anims(field, moves, spawns) -> dict:
+    # resolve_turnの結果をピクセル座標にする。(x, 落ちた先のy) -> (elem, 始まりのy, 終わりのy)
+    # 動かないジェムは普通のマスとして描くので入れない
+    step = SLOT_W + SLOT_PAD
+    falling = {}
+
+    for x, org_y, dest_y, elem in moves:
+        if org_y != dest_y:
+            falling[(x, dest_y)] = (elem, FIELD_Y + org_y * step, FIELD_Y + dest_y * step)
+        field[dest_y][x] = elem
+
+    for x, dest_y, elem, missing_count in spawns:
+        falling[(x, dest_y)] = (elem, FIELD_Y + (dest_y - missing_count - 1) * step - 20, FIELD_Y + dest_y * step)
+        field[dest_y][x] = elem
+    return falling
+
+def draw_falling(screen, falling, t) -> Optional[pg.Rect]:
+    step = SLOT_W + SLOT_PAD
+    blits = []
+    for (x, _), (elem, start_y, end_y) in falling.items():
+        current_y = start_y + (end_y - start_y) * t
+        blits.append(gem_blit(elem, LEFT_MARGIN + x * step + SLOT_W // 2, int(current_y + SLOT_W // 2)))
+    rects = screen.blits(blits)
+    if not rects:
+        return None
+    return rects[0].unionall(rects[1:])
+
+def animation_fall(comp, falling, t):
+    # 落ちているジェムはまとめて1つの部品にする。t は "fall" のtweenの値 (in_quad)
+    if not falling or t is None:
+        comp.clear("gems", "fall")
+        return
+    comp.part("gems", "fall", (id(falling), t), lambda s: draw_falling(s, falling, t))
+
+def shake(timeline, key) -> int:
+    # 攻撃を受けたときの横揺れ。だんだん小さくなる
+    v = timeline.value(key)
+    if v is None:
+        return 0
+    return int(math.sin(v * math.pi * 6) * 6 * (1 - v))
+
+# ---------------- ジェムのアトラス ----------------
+# 毎フレーム円と記号を描くと重いので、起動時に属性×倍率ごとに焼いておいて貼るだけにする
+# 倍率は0.05刻み (脈打つアニメーションの1.0〜1.6) + DRAG_SCALE
+ATLAS_STEP = 20
+ATLAS_MAX_SCALE = 1.6
+gem_atlas: dict = {}
+
+def atlas_scale(scale: float) -> float:
+    if scale == DRAG_SCALE:
+        return DRAG_SCALE
+    scale = min(ATLAS_MAX_SCALE, max(1.0, scale))
+    return round(scale * ATLAS_STEP) / ATLAS_STEP
+
+def build_gem_atlas(font):
+    scales = {atlas_scale(1.0 + i / ATLAS_STEP) for i in range(int((ATLAS_MAX_SCALE - 1.0) * ATLAS_STEP) + 1)}
+    scales.add(DRAG_SCALE)
+
+    # マスの端からジェムまでのすき間 (6列で10px)
+    margin = min(10, max(2, SLOT_W // 5))
+    for elem, color in COLOR_RGB.items():
+        sym = font.render(ELEMENT_SYMBOLS[elem], True, (0, 0, 0))
+        limit = int(SLOT_W * 0.6)
+        if sym.get_height() > limit:
+            # 大きい盤面ではマスが小さいので記号も縮める
+            k = limit / sym.get_height()
+            sym = pg.transform.smoothscale(sym, (max(1, int(sym.get_width() * k)), limit))
+        for scale in scales:
+            r = int((SLOT_W//2 - margin) * scale)
+            for with_shadow in (False, True):
+                size = max(r*2+6, sym.get_width(), sym.get_height())
+                c = size // 2
+                surf = pg.Surface((size, size), pg.SRCALPHA)
+                if with_shadow:
+                    pg.draw.circle(surf, DRAG_SHADOW, (c, c), r+3)
+                pg.draw.circle(surf, color, (c, c), r)
+                surf.blit(sym, (c - sym.get_width()//2, c - sym.get_height()//2))
+                gem_atlas[(elem, scale, with_shadow)] = surf.convert_alpha()
+
+    # 盤面のマス (通常 / ホバー)
+    for key, base_color in (("slot", (35, 35, 40)), ("slot_hover", (60, 60, 80))):
+        surf = pg.Surface((SLOT_W, SLOT_W), pg.SRCALPHA)
+        pg.draw.rect(surf, base_color, surf.get_rect(), border_radius=8)
+        gem_atlas[key] = surf.convert_alpha()
+
+def gem_blit(elem: str, x: int, y: int, scale=1.0, with_shadow=False) -> tuple:
+    # (x, y) を中心にしてblitsに渡す形で返す
+    surf = gem_atlas[(elem, atlas_scale(scale), with_shadow)]
+    return surf, (x - surf.get_width()//2, y - surf.get_height()//2)
+
+def cell_scale(timeline, x, y) -> float:
+    scale = 1.0
+    if (x, y) not in timeline.cells:
+        return scale
+
+    # スキルで変わったジェム: 1.0 -> 1.6 -> 1.0
+    wave = timeline.value(("pulse", x, y))
+    if wave is not None:
+        scale = 1.0 + (0.6 * wave)
+
+    # 消える直前に少しふくらむ
+    pop = timeline.value(("pop", x, y))
+    if pop is not None:
+        scale = max(scale, 1.0 + (0.4 * pop))
+    return scale
 
 def draw_heart_icon(screen, x, y, size=20, color=(255, 100, 100)):
     r = size // 4
@@ -437,67 +325,70 @@ def draw_heart_icon(screen, x, y, size=20, color=(255, 100, 100)):
     ]
     pg.draw.polygon(screen, color, triangle_points)
 
-def draw_members(screen, partylist, sukill_turn) -> list:
-    party_buttons = []
-
-    # スキルデータctと、sukill_turnのindexによってスキル発動できるなら背景を白くする
+def member_card(i, member, skill, sukill_turn):
+    # パーティのカードの位置と背景色。スキルが見つからなければNone
+    if skill is None:
+        log_ui.error("スキルは見つかりません (%d番目)", i)
+        return None
 
-    for i, member in enumerate(partylist):
-        skillname = member['skills']
-        skill_data = SKILLS.get(skillname)
-        if skill_data is None:
-            print("エラー: スキルは見つかりません")
-            continue
+    ct = skill.ct
 
-        ct = skill_data["ct"]
 
+    rect_x = MEMBER_LEFT + i * (MEMBER_W + MEMBER_PAD)
+    rect_y = WIN_H * 0.4
 
-        rect_x = LEFT_MARGIN + i * (SLOT_W + SLOT_PAD)
-        rect_y = WIN_H * 0.4
+    bg_color = (35, 35, 40)
 
-        elem = member["element"]
-        # 黒
-        border_color = COLOR_RGB[elem]
-        bg_color = (35, 35, 40)
+    if sukill_turn[i] >= ct:
+        color_min = (35, 35, 40)
+        color_max = (60, 60, 80)
 
-        if sukill_turn[i] >= ct:
-            t = time.time() * 5
-            wave = (math.sin(t) + 1) / 2  # 0.0 〜 1.0 に正規化
-            
-            color_min = (35, 35, 40)
-            color_max = (60, 60, 80)
+        speed = 4.0
+        t = time.time()
+        wave = (math.sin(t * speed) + 1) / 2  # 0.0 〜 1.0 に正規化
 
-            speed = 4.0
-            t = time.time()
-            wave = (math.sin(t * speed) + 1) / 2
+        r = color_min[0] + (color_max[0] - color_min[0]) * wave
+        g = color_min[1] + (color_max[1] - color_min[1]) * wave
+        b = color_min[2] + (color_max[2] - color_min[2]) * wave
 
-            r = color_min[0] + (color_max[0] - color_min[0]) * wave
-            g = color_min[1] + (color_max[1] - color_min[1]) * wave
-            b = color_min[2] + (color_max[2] - color_min[2]) * wave
+        bg_color = (int(r), int(g), int(b))
 
-            bg_color = (int(r), int(g), int(b))
+        rect_y -= 5
 
-            rect_y -= 5
 
+    rect = pg.Rect(rect_x, rect_y, MEMBER_W, MEMBER_W)
+    return rect, bg_color
 
-        rect = pg.Rect(rect_x, rect_y, SLOT_W, SLOT_W)
-        
-        party_buttons.append({
-            "rect": rect,
-            "data": partylist[i]
-        })
+def draw_member_card(screen, member, rect, bg_color) -> pg.Rect:
+    elem = member.element
+    # 黒
+    border_color = COLOR_RGB[elem]
 
-        pg.draw.rect(screen, bg_color, rect, border_radius=8)
-        pg.draw.rect(screen, border_color, rect, width=4, border_radius=8)
+    pg.draw.rect(screen, bg_color, rect, border_radius=8)
+    pg.draw.rect(screen, border_color, rect, width=4, border_radius=8)
 
-        img = member["display_image"]
+    img = unit_images[member.name]
 
-        img_rect = img.get_rect(center=rect.center)
-        screen.blit(img, img_rect)
+    img_rect = img.get_rect(center=rect.center)
+    screen.blit(img, img_rect)
+    return rect
 
+def member_buttons(party, sukill_turn) -> list:
+    # 描かずに当たり判定だけ返す
+    party_buttons = []
+    for i, (member, skill) in enumerate(zip(party.allies, party.slot_skills)):
+        card = member_card(i, member, skill, sukill_turn)
+        if card is None:
+            continue
+        party_buttons.append({
+            "rect": card[0],
+            "data": member,
+            "skill": skill,
+            "index": i
+        })
     return party_buttons
 
-def draw_unit_status(screen, cx, y, current_hp, max_hp, font, heart_color):
+def unit_status_layout(cx, y):
     bar_w = int(WIN_W * 0.81)
     bar_h = int(WIN_H * 0.02)
     icon_size = 20
@@ -514,93 +405,68 @@ def draw_unit_status(screen, cx, y, current_hp, max_hp, font, heart_color):
         content_width + padding * 2, 
         max(icon_size, bar_h) + padding * 2
     )
-    pg.draw.rect(screen, (150, 150, 180), border_rect, width=1, border_radius=4)
 
-    heart_center_x = start_x + (icon_size // 2)
-    heart_center_y = y + (max(icon_size, bar_h) // 2)
-    draw_heart_icon(screen, heart_center_x, heart_center_y, size=icon_size, color=heart_color)
+    heart_center = (start_x + (icon_size // 2), y + (max(icon_size, bar_h) // 2))
 
     bar_x = start_x + icon_size + gap
     bar_y = y + (max(icon_size, bar_h) - bar_h) // 2
-    
-    hp_surf = hp_bar_surf(current_hp, max_hp, bar_w, bar_h)
-    screen.blit(hp_surf, (bar_x, bar_y))
+    bar_rect = pg.Rect(bar_x, bar_y, bar_w, bar_h)
 
-    text = f"{int(current_hp)}/{max_hp}"
-    t_surf = font.render(text, True, (255, 255, 255))
-    
-    # 右寄せ計算
-    text_x = (bar_x + bar_w) - t_surf.get_width()
-    text_y = bar_y - 10
+    return border_rect, heart_center, icon_size, bar_rect
 
-    # 文字が見えやすいように少し影をつける（オプション）
-    shadow = font.render(text, True, (0, 0, 0))
-    screen.blit(shadow, (text_x + 1, text_y + 1))
-    
-    screen.blit(t_surf, (text_x, text_y))
+# 枠とハートは変わらないので背景に描く
+def draw_unit_frame(screen, cx, y, heart_color):
+    border_rect, heart_center, icon_size, _ = unit_status_layout(cx, y)
+    pg.draw.rect(screen, (150, 150, 180), border_rect, width=1, border_radius=4)
+    draw_heart_icon(screen, heart_center[0], heart_center[1], size=icon_size, color=heart_color)
 
-def draw_top(screen, enemy, party, font, sukill_turn ) -> list:
-    cx = WIN_W // 2
+def draw_unit_hp(screen, cx, y, current_hp, max_hp, font) -> pg.Rect:
+    _, _, _, bar_rect = unit_status_layout(cx, y)
+
+    fill_w, col = hp_bar_style(current_hp, max_hp, bar_rect.w)
+    text = f"{int(current_hp)}/{max_hp}"
+    surf, (ox, oy) = _hp_panel(fill_w, col, text, bar_rect.w, bar_rect.h, font)
+    return screen.blit(surf, (bar_rect.x + ox, bar_rect.y + oy))
+
+def draw_enemy(screen, enemy, font, dx=0) -> pg.Rect:
+    cx = WIN_W // 2 + dx
 
     # --- 敵画像 ---
-    img = enemy["display_image"]
-    screen.blit(img, (cx - 128, 10))
+    img = unit_images[enemy.name]
+    img_rect = screen.blit(img, (cx - 128, 10))
 
     # --- 敵の名前 ---
-    name = font.render(enemy["name"], True, (255, 255, 255))
+    name = font.render(enemy.name, True, (255, 255, 255))
     name_rect = name.get_rect(center=(cx, 250))
     screen.blit(name, name_rect)
+    return img_rect.union(name_rect)
 
-    # --- 敵のステータス ---
-    draw_unit_status(
-        screen, cx, 280, 
-        enemy["hp"], enemy["max_hp"], 
-        font, (200, 100, 255)
-    )
-
-    # --- 味方のステータス ---
-    draw_unit_status(
-        screen, cx, int(WIN_H * 0.5), 
-        party["hp"], party["max_hp"], 
-        font, (255, 80, 80)
-    )
-
-    
-    # pa-thi-you no atari hantei wo kaerichi toshite kaesu youni suru
-    party_buttons = draw_members(screen, partylist, sukill_turn)
-    
-    return party_buttons
-
-def draw_message(screen, text, font):
+def draw_message(screen, text, font) -> pg.Rect:
     surf = font.render(text, True, (230,230,230))
-    screen.blit(surf,(40,460))
-
-def keep_aspect(img, max_w, max_h):
-    w, h = img.get_size()
-    
-    scale_w = max_w / w
-    scale_h = max_h / h
-    
-    scale = min(scale_w, scale_h)
-    
-    new_w = int(w * scale)
-    new_h = int(h * scale)
-    
-    return pg.transform.smoothscale(img, (new_w, new_h))
-
-def draw_timer_bar(screen, cx, cy, start_time):
-    now = time.time()
+    return screen.blit(surf,(40,460))
+
+def draw_preview(screen, cx, cy, combo, cleared, font) -> pg.Rect:
+    # ドラッグ中に、今離したら消える塊の数。指の上 (タイマーのさらに上) に出す
+    color = (255, 220, 80) if combo else (170, 170, 170)
+    surf = font.render(f"{combo} コンボ ({cleared}個)", True, color)
+    rect = surf.get_rect(midbottom=(cx, cy - 44))
+    pg.draw.rect(screen, (0, 0, 0), rect.inflate(8, 2), border_radius=4)
+    screen.blit(surf, rect)
+    return rect.inflate(8, 2)
+
+def timer_ratio(start_time, now) -> float:
     elapsed = now - start_time
     remaining = max(0, time_limit - elapsed)
-    ratio = remaining / time_limit 
+    return remaining / time_limit 
 
+def draw_timer_bar(screen, cx, cy, ratio) -> pg.Rect:
     bar_w = 60
     bar_h = 6
     
     x = cx - bar_w // 2
     y = cy - 40 
 
-    pg.draw.rect(screen, (0, 0, 0), (x, y, bar_w, bar_h))
+    frame = pg.draw.rect(screen, (0, 0, 0), (x, y, bar_w, bar_h))
     
     if ratio > 0.5:
         color = (0, 255, 0)
@@ -610,143 +476,285 @@ def draw_timer_bar(screen, cx, cy, start_time):
         color = (255, 0, 0)
 
     pg.draw.rect(screen, color, (x, y, int(bar_w * ratio), bar_h))
-# ---------------- skills ----------------
-def skills(target_data, field, buffs, gem_animations, enemy, def_cut) -> tuple[str,int]:
-    name = target_data['skills']
-    skill_data = SKILLS.get(name)
-
-    defc = def_cut
-
-    message = ""
-
-    if not skill_data:
-        return "スキルデータが見つかりません", defc
-    if "makegem" in skill_data:
-        message = makegem(skill_data, field, gem_animations)
-    elif "buff" in skill_data:
-        message = buff_party(skill_data, buffs)
-    elif "attack" in skill_data:
-        message = AttackSkill(skill_data, enemy)
-    elif "defence" in skill_data:
-        message, defc = defence(skill_data, def_cut)
-    # 念の為
-    else:
-        return f"{skill_data['effect']}", defc
-    
-    return message, defc
-
-# def_cutどうやって返そう...
-def defence(skill, def_cut) -> tuple[str, int]:
-    message = str(skill['effect'])
-    ef = skill["defence"]
-    num = ef["num"]
-
-    def_cut = num
-
-    return message, def_cut
-
-
-
-def AttackSkill(skill, enemy) -> str:
-    message = str(skill['effect'])
-    ef = skill["attack"]
-    num = ef["num"]
-    damage = int(enemy["max_hp"] * num)
-
-    enemy["hp"] = max(0, enemy["hp"] - damage)
-
-    return message
-
-def buff_party(skill, buffs) -> str:
-    ef = skill["buff"]
-    target_gem = ef["elem"]
-    num = ef["num"]
-    turn = ef["turn"]
-    message = str(skill['effect'])
-
-    buffs[target_gem].append({'count': turn, 'num': num}) 
-
-
-    return message
-
-def makegem(skill, field, animation_list) -> str:
-    rows = len(field)
-    cols = len(field[0])
-
-    ef = skill["makegem"]
-    # 変更する配列が入っている
-    target_gems = ef["elem"]
-    make_gem_count = ef["make"]
-
-    skip_set = set(target_gems)
-    not_target = []
-
-    for y in range(rows):
-        for x in range(cols):
-            current_gem = field[y][x]
-            if current_gem not in skip_set:
-                not_target.append((x, y))
-    
-    message = str(skill['effect'])
-
-    if not not_target:
-        return message
+    return frame
+
+# ---------------- ヒント ----------------
+HINT_TIME = 3.0
+
+def cell_center(x, y) -> tuple[int, int]:
+    return (LEFT_MARGIN + x * (SLOT_W + SLOT_PAD) + SLOT_W // 2, FIELD_Y + y * (SLOT_W + SLOT_PAD) + SLOT_W // 2)
+
+def draw_hint(screen, path) -> pg.Rect:
+    # ドラッグの軌跡を線でつなぐ。始点は丸で囲む
+    points = [cell_center(x, y) for x, y in path]
+    rect = pg.draw.circle(screen, (255, 255, 255), points[0], SLOT_W // 2 - 4, 3)
+    if len(points) > 1:
+        rect = rect.union(pg.draw.lines(screen, (255, 255, 255), False, points, 4))
+    return rect.inflate(4, 4)
+
+def path_events(path, frames_per_move=4) -> list:
+    # 自動プレイ用。軌跡を1フレームごとのマウスのイベントに直す
+    points = [cell_center(x, y) for x, y in path]
+    frames = [[pg.event.Event(pg.MOUSEBUTTONDOWN, button=1, pos=points[0])]]
+    for pos in points[1:]:
+        frames += [[] for _ in range(frames_per_move - 1)]
+        frames.append([pg.event.Event(pg.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(1, 0, 0))])
+    frames.append([pg.event.Event(pg.MOUSEBUTTONUP, button=1, pos=points[-1])])
+    return frames
+
+# ---------------- スキルのカットイン ----------------
+# 暗幕は1枚だけ作って使い回す。キャラ画像と技名は起動時にメンバーごとに作っておく
+@lru_cache(maxsize=1)
+def dim_overlay(w: int, h: int) -> pg.Surface:
+    overlay = pg.Surface((w, h), pg.SRCALPHA)
+    overlay.fill((0, 0, 0, 150))
+    return overlay.convert_alpha()
+
+def build_cutin(raw: pg.Surface, skill_name: str, font) -> pg.Surface:
+    # raw は CUTIN_SIZE の画像 (縮小済みの unit_images から拡大しない)
+    text_surf = font.render(skill_name, True, (255, 255, 0))
+    # 画像の中心をSurfaceの中心に置く。技名はその150px下 (元の -50 / +100)
+    w = max(raw.get_width(), text_surf.get_width())
+    h = max(raw.get_height(), (150 + text_surf.get_height()) * 2)
+    surf = pg.Surface((w, h), pg.SRCALPHA)
+    surf.blit(raw, raw.get_rect(center=(w // 2, h // 2)))
+    surf.blit(text_surf, text_surf.get_rect(center=(w // 2, h // 2 + 150)))
+    return surf.convert_alpha()
+
+def draw_cutin(screen, p_data, font) -> pg.Rect:
+    # 暗幕
+    screen.blit(dim_overlay(WIN_W, WIN_H), (0, 0))
+
+    # キャラ画像や文字
+    cutin = cutin_images[(p_data.name, p_data.skills)]
+    screen.blit(cutin, cutin.get_rect(center=(WIN_W//2, WIN_H//2 - 50)))
+    return screen.get_rect()
+
+def draw_frame_hud(screen, lines, font) -> pg.Rect:
+    # フレーム時間の表。数字は列ごとに右揃えで並べる
+    x, y = 8, 30
+    line_h = font.get_linesize()
+    area = pg.Rect(x - 4, y - 4, 230, line_h * len(lines) + 8)
+    screen.fill((0, 0, 0, 170), area)
+    for n, line in enumerate(lines):
+        color = (255, 255, 0) if n == 0 else (230, 230, 230)
+        cols = line.split()
+        screen.blit(font.render(cols[0], True, color), (x, y + n * line_h))
+        for c, v in enumerate(cols[1:]):
+            surf = font.render(v, True, color)
+            screen.blit(surf, surf.get_rect(topright=(x + 120 + c * 50, y + n * line_h)))
+    return area
+
+# ---------------- レイヤー合成 ----------------
+# 下から 背景(マス・枠) -> 敵 -> パーティ -> ジェム -> 文字など -> スキルのカットイン -> 計測の表示
+LAYERS = ["enemy", "party", "gems", "overlay", "cutin", "hud"]
+
+def draw_background(screen, field):
+    screen.fill((22, 22, 28))
+    slot = gem_atlas["slot"]
+    for y in range(len(field)):
+        for x in range(len(field[0])):
+            screen.blit(slot, (LEFT_MARGIN + x * (SLOT_W + SLOT_PAD), FIELD_Y + y * (SLOT_W + SLOT_PAD)))
+    draw_unit_frame(screen, WIN_W // 2, 280, (200, 100, 255))
+    draw_unit_frame(screen, WIN_W // 2, int(WIN_H * 0.5), (255, 80, 80))
+
+def compose_top(comp, enemy, party, font, sukill_turn, timeline):
+    cx = WIN_W // 2
+    edx = shake(timeline, "hit_enemy")
+    comp.part("enemy", "enemy", (enemy.name, edx), lambda s: draw_enemy(s, enemy, font, edx))
 
-    count = min(len(not_target), make_gem_count)
+    hp = (enemy.hp, enemy.max_hp)
+    comp.part("enemy", "enemy_hp", hp, lambda s: draw_unit_hp(s, cx, 280, hp[0], hp[1], font))
 
-    chose = random.sample(not_target, count)
+    pdx = shake(timeline, "hit_party")
+    php = (party.hp, party.max_hp, pdx)
+    comp.part("party", "party_hp", php, lambda s: draw_unit_hp(s, cx + pdx, int(WIN_H * 0.5), php[0], php[1], font))
 
-    for x, y in chose:
-        # 作るジェムが複数種あるなら、そこからランダムに選ぶ
-        new_gem = random.choice(target_gems)
-        
-        field[y][x] = new_gem
-        animation_list.append({ "x": x, "y": y, "start_time": time.time(), "duration": 0.6})
+    for i, (member, skill) in enumerate(zip(party.allies, party.slot_skills)):
+        card = member_card(i, member, skill, sukill_turn)
+        if card is None:
+            continue
+        rect, bg_color = card
+        comp.part("party", ("member", i), (rect.y, bg_color),
+                  lambda s, m=member, r=rect, c=bg_color: draw_member_card(s, m, r, c))
+
+def draw_cell(screen, x, y, elem, is_hover, scale) -> pg.Rect:
+    rect_x = LEFT_MARGIN + x * (SLOT_W + SLOT_PAD)
+    rect_y = FIELD_Y + y * (SLOT_W + SLOT_PAD)
+    rect = pg.Rect(rect_x, rect_y, SLOT_W, SLOT_W)
+    # 通常のマスは背景にあるので、ホバーのときだけ上から塗る
+    if is_hover:
+        screen.blit(gem_atlas["slot_hover"], rect)
+    if elem and elem != "無":
+        surf, pos = gem_blit(elem, rect.centerx, rect.centery, scale)
+        rect = rect.union(screen.blit(surf, pos))
+    return rect
+
+class FieldLayer:
+    # 盤面のマスの部品。全部のマスを毎フレーム見ずに、前のフレームから変わりうるマスだけ comp.part に渡す
+    # (中身が変わった行 / 今か前のフレームで動いていたマス / ホバーとドラッグ元 / 落下の始めと終わり)
+    def __init__(self):
+        self.comp = None
+        self.size = None
+        # 前のフレームの盤面の写し (行ごと)
+        self.rows = []
+        # 前のフレームで tween が付いていたマス
+        self.animated = set()
+        self.marks = (None, None)
+        self.falling = None
+        self.falling_keys = ()
+
+    def compose(self, comp, field, timeline, hover_pos=None, drag_src=None, drag_elem=None, falling=None):
+        rows, cols = len(field), len(field[0])
+        if comp is not self.comp or self.size != (rows, cols):
+            # 最初と大きさが変わったときは全部のマスを見る
+            self.comp = comp
+            self.size = (rows, cols)
+            self.rows = [None] * rows
+
+        todo = set(self.animated)
+        self.animated = set(timeline.cells)
+        todo |= self.animated
+        for y, row in enumerate(field):
+            if row != self.rows[y]:
+                self.rows[y] = row[:]
+                todo.update((x, y) for x in range(cols))
+        marks = (hover_pos, drag_src)
+        if marks != self.marks:
+            todo.update(p for p in self.marks + marks if p is not None)
+            self.marks = marks
+        if falling is not self.falling:
+            todo.update(self.falling_keys)
+            self.falling = falling
+            self.falling_keys = tuple(falling) if falling else ()
+            todo.update(self.falling_keys)
+
+        # 重なったジェム (ふくらんだとき) の描く順番が変わらないように、上の行から
+        for x, y in sorted(todo, key=lambda p: (p[1], p[0])):
+            if not (0 <= x < cols and 0 <= y < rows):
+                continue
+            # 落ちている途中のジェムは animation_fall で描く
+            elem = None if drag_src == (x, y) or (falling and (x, y) in falling) else field[y][x]
+            is_hover = (hover_pos == (x, y))
+            scale = atlas_scale(cell_scale(timeline, x, y))
+            comp.part("gems", (x, y), (elem, is_hover, scale),
+                      lambda s, x=x, y=y, e=elem, h=is_hover, sc=scale: draw_cell(s, x, y, e, h, sc))
+
+        if drag_elem is not None:
+            mx, my = pg.mouse.get_pos()
+            comp.part("overlay", "drag", (drag_elem, mx, my),
+                      lambda s: s.blit(*gem_blit(drag_elem, mx, my - 4, DRAG_SCALE, with_shadow=True)))
+        else:
+            comp.clear("overlay", "drag")
+
+# 画像の大きさ (AssetManager で (名前, 大きさ) ごとに1回だけ作る)
+CUTIN_SIZE = (256, 256)
+
+def member_image_size() -> tuple[int, int]:
+    return (int(MEMBER_W * 0.9), int(MEMBER_W * 0.9))
+
+def enemy_image_size() -> tuple[int, int]:
+    return (int(WIN_W * 0.1), int(WIN_W * 0.1))
+
+# 名前 -> 表示用の画像、(名前, スキル名) -> カットイン (Unit は __slots__ なので画像は持たせない)
+unit_images: dict = {}
+cutin_images: dict = {}
+
+def load_unit_images(game, font, assets):
+    # main() を呼び直したとき用に、前の画面で作ったものは捨てる
+    unit_images.clear()
+    cutin_images.clear()
+    for member in game.party.allies:
+        unit_images[member.name] = assets.image(member.name, member_image_size())
+        # 同じキャラが2人いてもカットインは1枚
+        key = (member.name, member.skills)
+        if key not in cutin_images:
+            cutin_images[key] = build_cutin(assets.image(member.name, CUTIN_SIZE), member.skills, font)
+    ensure_enemy_image(game, assets)
+
+def ensure_enemy_image(game, assets):
+    # 今の敵の画像を用意して、次の敵の画像は裏で読み始めておく
+    enemy = game.enemy
+    if enemy.name in unit_images:
+        return
+    unit_images[enemy.name] = assets.image(enemy.name, enemy_image_size())
+    nxt = game.enemy_idx + 1
+    if nxt < len(game.enemies):
+        assets.preload(game.enemies[nxt].name, enemy_image_size())
 
-    return message
 # ---------------- メイン ----------------
-def main():
-    # kakudai hyouji
-    screen = pg.display.set_mode((WIN_W, WIN_H))
-    pg.display.set_caption("Puzzle & Monsters - GUI Prototype")
+def main(seed: Optional[int] = None, log_path: Optional[str] = None, speed: float = 1.0,
+         frametime_csv: Optional[str] = None, fps: int = 60, fixed_dt: Optional[float] = None,
+         inputs=None, save_path: Optional[str] = None, load_path: Optional[str] = None,
+         rows: int = BOARD_ROWS, cols: int = BOARD_COLS):
+    # ベンチマーク用 (bench_game.py)
+    #   fps=0 で上限なし、fixed_dt を渡すとゲームの時計は1フレームごとにその秒数だけ進む
+    # ゲームの中身は FixedStep で 1/120 秒ずつ進め、描画はフレームに1回 (fixedstep.py)
+    #   inputs は1フレームごとのイベントのリストを返すイテレータ。尽きたら終了する
+    # load_path を渡すとそのセーブデータの続きから。ターンが終わるたびに save_path にセーブする
+    # rows / cols は盤面の大きさ (セーブデータから始めるときはセーブデータの大きさ)
+    if load_path is not None:
+        game = read_game(load_path)
+        streams = game.streams
+    else:
+        streams = RngStreams(seed)
+        game = new_game(streams, rows, cols)
+    field = game.field
+
+    # マスの大きさは盤面の大きさで決まるので、ゲームを作ってから画面を開く
+    screen = open_window(len(field), len(field[0]))
     font = get_jp_font(20)
-    gem_animations = []
+    build_gem_atlas(font)
+    comp = Compositor(screen, LAYERS)
+    field_layer = FieldLayer()
+    # アニメーションと待ち時間は全部ここで進める (F5で速さを変える)
+    timeline = Timeline(speed)
+
+    def pulse_gem(x, y, duration):
+        # makegem で変わったジェム。tween の入れ物は timeline が使い回す
+        timeline.cell_tween("pulse", x, y, duration, "pulse")
 
     skill_queue = [] 
+    # H でヒント、P で自動プレイ
+    hint_path = None
+    autoplay = False
+    # pool は自動プレイを ON にしたときに1回だけ作って、OFF にするまで使い回す
+    bot = {"thread": None, "result": None, "pool": None}
+    bot_events = []
     current_processing = None
 
-    drg_start_time = 0.0
-
-    party = {
-        "player_name":"Player",
-        "allies": partylist,
-        "hp":600, "max_hp":600, "dp":(10+10+5+15)/4
-    }
-    enemies = [
-        {"name":"スライム","element":"水","hp":100,"max_hp":100,"ap":10,"dp":1},
-        {"name":"ゴブリン","element":"土","hp":200,"max_hp":200,"ap":20,"dp":5},
-        {"name":"オオコウモリ","element":"風","hp":300,"max_hp":300,"ap":30,"dp":10},
-        {"name":"ウェアウルフ","element":"風","hp":400,"max_hp":400,"ap":40,"dp":15},
-        {"name":"ドラゴン","element":"火","hp":600,"max_hp":600,"ap":50,"dp":20},
-    ]
-    enemy_idx=0
-    enemy = enemies[enemy_idx]
-    field = init_field()
+    # ドラッグで最初に動かしたときのゲームの時計 (まだ動かしていなければ None)
+    drg_start_time: Optional[float] = None
+
+    party = game.party
+    sukill_turn = game.sukill_turn
+    if log_path is None:
+        log_path = os.path.join("replays", f"{time.strftime('%Y%m%d-%H%M%S')}_{streams.seed}.json")
+    if save_path is None:
+        save_path = os.path.join("saves", "autosave.sav")
+    # セーブとターンログはファイルに書くのを裏のスレッドに任せる (ループを止めない)
+    autosaver = Autosaver()
 
     drag_src: Optional[tuple[int, int]] = None
+    drag_path: list[tuple[int, int]] = []
     drag_elem: Optional[str] = None
     hover_pos: Optional[tuple[int, int]] = None
+    # ドラッグ中の消える予定 (入れ替えるたびにその行と列だけ見直す)
+    preview: Optional[MatchIndex] = None
 
-    for member in party["allies"]:
-        raw = load_monster_image(member["name"])
-        img = keep_aspect(raw, int(SLOT_W * 0.9), int(SLOT_W * 0.9))
-        member["display_image"] = img
-    for en in enemies:
-        raw = load_monster_image(en["name"])
-        img = keep_aspect(raw, int(WIN_W * 0.1), int(WIN_W * 0.1))
-        en["display_image"] = img
+    assets = AssetManager(os.path.join(CACHE_DIR, "images"))
+    load_unit_images(game, font, assets)
+
+    comp.set_background(lambda s: draw_background(s, field))
+    # F2で1フレームに送ったピクセル数を表示
+    show_pixels = False
+    # F3でフレーム時間の表を表示、F4でCSVに書き出す
+    frames = FrameTimer()
+    show_frametime = False
+    hud_font = get_jp_font(14)
 
     clock = pg.time.Clock()
+    step = FixedStep()
 
     def get_grid_pos_at_mouse(mx: int, my: int) -> Optional[tuple[int, int]]:
         grid_x = (mx - LEFT_MARGIN) // (SLOT_W + SLOT_PAD)
@@ -762,312 +770,348 @@ def main():
     running = True
 
     turn_processed = False
+    # 指を離した/時間切れになったフレームで立てて、イベント処理のあとでターンを始める
+    turn_ready = False
+    # 再生中の盤面 (解決前のコピー) と、落ちている途中のジェム
+    view = None
+    falling = None
 
 
     message = ""
-    # bairitsu それぞれの属性のところに、効果時間と倍率をもった辞書の集まりにしてやって、効果時間が０なら辞書から削除、ターン終了時に効果時間を０にしてやればいい
-    buffs = {
-                "火": [
-                        # example
-                        #  {'count': x, 'num': y}
-                    ],
-                "水": [],
-                "風": [],
-                "土": [],
-                "命": []
-            }
-    # --- index -> hidari kara no junban de skill turn wo teigi ---
-    sukill_turn = [0, 0, 0, 0, 0, 0]
-    turn = 0
-
-    # (1 - def_cut)を相手の攻撃力にかける。
-    def_cut = 0.0
+
+    def start_turn():
+        nonlocal view
+        log_turn(game.log, drag_path)
+        view = [row[:] for row in field]
+        events = resolve_turn(field, streams.skyfall)
+        base = message
+
+        # イベントを順番にタイムラインへ積んでおく
+        t = 0.0
+        moves = []
+        for ev in events:
+            if ev["type"] == "clear":
+                timeline.call(t, lambda ev=ev: show_clear(ev, base))
+                t += CLEAR_TIME
+            elif ev["type"] == "fall":
+                moves = ev["moves"]
+            elif ev["type"] == "spawn":
+                timeline.call(t, lambda m=moves, sp=ev["gems"]: start_fall(m, sp))
+                t += FALL_TIME + FALL_HOLD
+        timeline.call(t, lambda: finish_turn(events[-1]))
+
+    def show_clear(ev, base):
+        nonlocal message
+        message = f"コンボ {ev['combo']}！ {base}"
+        for (gx, gy) in ev["coords"]:
+            def remove(gx=gx, gy=gy):
+                view[gy][gx] = "無"
+            timeline.cell_tween("pop", gx, gy, POP_TIME, "out_quad", on_done=remove)
+
+    def start_fall(moves, spawns):
+        nonlocal message, falling
+        message = "落下中..."
+        falling = fall_anims(view, moves, spawns)
+
+        def landed():
+            nonlocal falling
+            falling = None
+        timeline.tween("fall", FALL_TIME, "in_quad", on_done=landed)
+
+    def finish_turn(last):
+        nonlocal message, view
+        view = None
+        combo = last["combo"]
+        to_do = last["to_do"]
+
+        party_turn(game, combo, to_do)
+        if any(v for elem, v in to_do.items() if elem != "命"):
+            timeline.tween("hit_enemy", 0.3)
+
+        message, attacked = enemy_turn(game)
+        if attacked:
+            # 攻撃エフェクト
+            timeline.tween("hit_party", FRAME_DELAY)
+            timeline.call(FRAME_DELAY, lambda: end_player_turn(True))
+        else:
+            end_player_turn(False)
+
+    def end_player_turn(attacked):
+        nonlocal message, turn_processed
+        if attacked and party.hp <= 0:
+            message = "パーティは力尽きた…（ESCで終了）"
+        end_turn(game)
+        autosaver.save(game, save_path)
+        autosaver.write(log_path, encode_log(game.log))
+        turn_processed = False
 
     ismove = False
     while running:
-        party_buttons = draw_top(screen, enemy, party, font, sukill_turn )
-        mushi = (current_processing is not None) or turn_processed
-        for e in pg.event.get():
-            if e.type == pg.QUIT:
-                running = False
-
-            elif e.type == pg.KEYDOWN:
-                # if e.key == pg.K_ESCAPE:
-                #    running = False
-
-                print('a')
-            elif e.type == pg.MOUSEBUTTONDOWN and e.button == 1:
-                if mushi:
-                    continue
-
-                mouse_pos = e.pos
-                for i, btn in enumerate(party_buttons):
-                    skill_name = btn["data"]["skills"]
-                    skill_data = SKILLS.get(skill_name)
-                    if skill_data is None:
-                        print("エラー: スキルは見つかりません")
+        frames.next_frame()
+        dt = clock.tick(fps) / 1000
+        if fixed_dt is not None:
+            dt = fixed_dt
+        frames.lap("wait")
+        step.advance(dt)
+
+        if inputs is not None:
+            # 用意した入力を本物のイベントとして流す
+            for e in next(inputs, [pg.event.Event(pg.QUIT)]):
+                pg.event.post(e)
+
+        game_over = party.hp <= 0 or game.enemy_idx >= len(game.enemies)
+        idle = not (turn_processed or current_processing or skill_queue or drag_src or game_over)
+        if autoplay and idle and not bot_events and bot["thread"] is None:
+            # 探すのに数秒かかるので、別スレッドで探して(中はプロセスプール)画面は止めない
+            def think(board=[row[:] for row in field], weights=solver_weights(game), pool=bot["pool"]):
+                bot["result"] = solve(board, weights, time_limit, **BOT, pool=pool)
+            bot["thread"] = threading.Thread(target=think, daemon=True)
+            bot["thread"].start()
+            message = "考え中..."
+        if bot["thread"] is not None and not bot["thread"].is_alive():
+            bot["thread"] = None
+            if autoplay and bot["result"] is not None:
+                bot_events = path_events(bot["result"]["path"])
+        if bot_events:
+            for e in bot_events.pop(0):
+                pg.event.post(e)
+        party_buttons = member_buttons(party, sukill_turn)
+        frames.lap("hit_test")
+        # 来たイベントは時刻を付けて貯めるだけ。処理するのは下のステップの中
+        step.post(pg.event.get())
+        frames.lap("events")
+
+        for due in step.steps():
+            # 入力の処理は events、それ以外 (制限時間・タイムライン・スキル) は logic に足す
+            frames.lap("logic")
+            mushi = (current_processing is not None) or turn_processed
+            for e in due:
+                if e.type == pg.QUIT:
+                    running = False
+
+                elif e.type == pg.KEYDOWN:
+                    # if e.key == pg.K_ESCAPE:
+                    #    running = False
+                    if e.key == pg.K_F2:
+                        show_pixels = not show_pixels
+                        if not show_pixels:
+                            comp.clear("overlay", "pixels")
+                    elif e.key == pg.K_F3:
+                        show_frametime = not show_frametime
+                        if not show_frametime:
+                            comp.clear("hud", "frametime")
+                    elif e.key == pg.K_F4:
+                        path = frames.dump_csv(os.path.join("frametimes", f"{time.strftime('%Y%m%d-%H%M%S')}.csv"))
+                        message = f"保存しました: {path}"
+                    elif e.key == pg.K_F5:
+                        # 1倍 -> 2倍 -> 4倍 -> 1倍
+                        timeline.speed = timeline.speed * 2 if timeline.speed < 4 else 1.0
+                    elif e.key == pg.K_h and idle:
+                        res = solve(field, solver_weights(game), time_limit, **HINT)
+                        if res is not None:
+                            hint_path = res["path"]
+                            timeline.tween("hint", HINT_TIME)
+                            message = f"ヒント: {res['combo']} コンボ"
+                    elif e.key == pg.K_p:
+                        autoplay = not autoplay
+                        bot_events = []
+                        if autoplay:
+                            bot["pool"] = new_pool(BOT["workers"])
+                        else:
+                            # 探している途中なら、その分が終わってから子プロセスが終わる
+                            bot["pool"].shutdown(wait=False)
+                            bot["pool"] = None
+                        message = "自動プレイ ON" if autoplay else "自動プレイ OFF"
+
+                    log_input.debug("key %s", pg.key.name(e.key))
+                elif e.type == pg.MOUSEBUTTONDOWN and e.button == 1:
+                    if mushi:
                         continue
 
-                    ct = skill_data["ct"]
-                    if (btn["rect"].collidepoint(mouse_pos) and sukill_turn[i] >= ct):
-                        skill_queue.append({
-                            "data": btn["data"], # 誰のスキルか
-                            "start_time": 0.0, # 開始時間は後で決める
-                            "index": i # 誰が使ったか
-                        })
+                    mouse_pos = e.pos
+                    for btn in party_buttons:
+                        i = btn["index"]
+                        if (btn["rect"].collidepoint(mouse_pos) and sukill_turn[i] >= btn["skill"].ct):
+                            skill_queue.append({
+                                "data": btn["data"], # 誰のスキルか
+                                "start_time": 0.0, # 開始時間は後で決める
+                                "index": i # 誰が使ったか
+                            })
                         
-                        sukill_turn[i] = 0
-                        target_data = btn["data"]
+                            sukill_turn[i] = 0
+                            target_data = btn["data"]
 
-                mx, my = mouse_pos
-                grid_pos = get_grid_pos_at_mouse(mx, my)
+                    mx, my = mouse_pos
+                    grid_pos = get_grid_pos_at_mouse(mx, my)
                 
-                if grid_pos:
-                    drag_src = grid_pos
-                    cx, cy = grid_pos
-                    drag_elem = field[cy][cx]
-                    drg_start_time = 0.0
-                    ismove = False
-
-            elif e.type == pg.MOUSEMOTION:
-                mx, my = e.pos
-
-                if drag_src is not None :
-                    rows = len(field)
-                    cols = len(field[0])
-
-                    raw_x = (mx - LEFT_MARGIN) // (SLOT_W + SLOT_PAD)
-                    raw_y = (my - FIELD_Y) // (SLOT_W + SLOT_PAD)
-
-                    nx = max(0, min(cols - 1, raw_x))
-                    ny = max(0, min(rows - 1, raw_y))
-
-                    hover_pos = (nx, ny)
-
-
-                    if hover_pos != drag_src:
-                        sx, sy = drag_src
-
-                        if abs(sx - nx) <= 1 and abs(sy - ny) <= 1:
-                            field[sy][sx], field[ny][nx] = field[ny][nx], field[sy][sx]
-                            drag_src = hover_pos
-                            ismove = True
-                            if drg_start_time == 0:
-                                drg_start_time = time.time()
-                else:
-                    hover_pos = get_grid_pos_at_mouse(mx, my)
-
-
-            elif e.type == pg.MOUSEBUTTONUP and e.button == 1:
-                # ドラッグしていたなら、手を離した時点でパズル判定へ(仕様)
-                if drag_src is not None:
-
-                    if ismove:
-                        turn_processed = True
+                    if grid_pos:
+                        hint_path = None
+                        drag_src = grid_pos
+                        drag_path = [grid_pos]
+                        cx, cy = grid_pos
+                        drag_elem = field[cy][cx]
+                        preview = MatchIndex(field)
+                        drg_start_time = None
+                        ismove = False
+
+                elif e.type == pg.MOUSEMOTION:
+                    mx, my = e.pos
+
+                    if drag_src is not None :
+                        rows = len(field)
+                        cols = len(field[0])
+
+                        raw_x = (mx - LEFT_MARGIN) // (SLOT_W + SLOT_PAD)
+                        raw_y = (my - FIELD_Y) // (SLOT_W + SLOT_PAD)
+
+                        nx = max(0, min(cols - 1, raw_x))
+                        ny = max(0, min(rows - 1, raw_y))
+
+                        hover_pos = (nx, ny)
+
+
+                        if hover_pos != drag_src:
+                            sx, sy = drag_src
+
+                            if abs(sx - nx) <= 1 and abs(sy - ny) <= 1:
+                                preview.swap((sx, sy), (nx, ny))
+                                drag_src = hover_pos
+                                drag_path.append(hover_pos)
+                                ismove = True
+                                if drg_start_time is None:
+                                    drg_start_time = step.now
                     else:
-                        turn_processed = False
+                        hover_pos = get_grid_pos_at_mouse(mx, my)
 
-                    drag_src = None
-                    drag_elem = None
 
+                elif e.type == pg.MOUSEBUTTONUP and e.button == 1:
+                    # ドラッグしていたなら、手を離した時点でパズル判定へ(仕様)
+                    if drag_src is not None:
 
-            if drag_src is not None:
-                if drg_start_time > 0:
+                        if ismove:
+                            turn_ready = True
 
-                    now = time.time()
-                    if now - drg_start_time >= time_limit:
-                        turn_processed = True
                         drag_src = None
                         drag_elem = None
-                        message = "Time Up!"
-                        turn_processed = True
-
-            if turn_processed:
-                    combo = 0
-                    to_do = {"火": 0, "水": 0, "風": 0, "土": 0, "命": 0}
-
-                    while True:
-                        raw_matches = scan_grid(field)
-                        if not raw_matches: break 
-
-                        clusters = get_clusters(field, raw_matches)
-
-                        for cluster in clusters:
-                            combo += 1
-
-                            elem = cluster["color"]
-                            count = cluster["count"]     # その塊のジェム数
-                            coords = cluster["coords"]   # その塊の座標リスト
-
-                            # 倍率バカすぎるかも
-                            bonus = (count - 3) * 0.8
 
-                            score = 1.00 + bonus
-
-                            to_do[elem] += score 
-
-                            # 盤面からの削除
-                            for (gx, gy) in coords:
-                                field[gy][gx] = "無"
-                            current_time = time.time()
-                            gem_animations = [a for a in gem_animations if current_time - a["start_time"] < a["duration"]]
-
-                            # 描画関数に渡す
-                            # 描画更新
-                            screen.fill((22, 22, 28))
-                            draw_top(screen, enemy, party, font, sukill_turn)
-                            draw_field(screen, field, font, gem_animations)
-                            draw_message(screen, f"コンボ {combo}！ {message}", font)
-                            pg.display.flip()
-                            time.sleep(0.4)
-
-                        animation_fall(screen, field, font, sukill_turn, party, enemy)
-
-                    # ダメージ・回復計算
-                    for elem, value in to_do.items():
-                        if value == 0:
-                            continue
-
-                        if elem == "命":
-                            heal = jitter(20 * value)
-                            party["hp"] = min(party["max_hp"], party["hp"] + heal)
-                            message = f"HP +{heal}"
-                        else:
-                            default = 1.00
-                            for i in buffs[elem]:
-                                default *= i["num"]
-
-                            dmg = party_attack_from_gems(elem, value, combo, party, enemy, default)
-                            message = f"{elem}攻撃！ {dmg} ダメージ"
-
-
-                    if enemy["hp"] <= 0:
-                        message = f"{enemy['name']} を倒した！"
-
-                    if enemy["hp"] > 0:
-                        edmg = enemy_attack(party, enemy, def_cut)
-                        message = f"{enemy['name']}の攻撃！ -{edmg}"
-                        
-                        # 攻撃エフェクト
-                        screen.fill((22, 22, 28))
-                        draw_top(screen, enemy, party, font, sukill_turn )
-                        draw_field(screen, field, font, gem_animations)
-                        draw_message(screen, message, font)
-                        pg.display.flip()
-                        time.sleep(FRAME_DELAY)
-
-                        if party["hp"] <= 0:
-                            message = "パーティは力尽きた…（ESCで終了）"
-                    
-                    else:
-                        # 敵が倒れた -> 次の敵へ
-                        enemy_idx += 1
-                        if enemy_idx < len(enemies):
-                            enemy = enemies[enemy_idx]
-                            message = f"さらに奥へ… 次は {enemy['name']}"
-                        else:
-                            message = "ダンジョン制覇！おめでとう！（ESCで終了）"
-
-
-                    for i in range(len(sukill_turn)):
-                        sukill_turn[i] += 1
-
-                    for i in range(len(sukill_turn)):
-                        print(f"sukiru ta-n: {sukill_turn[i]}")
-
-
-                    for i, gem in enumerate(buffs):
-                        print(f"buff : {gem} :{buffs[gem]}")
-
-                    turn += 1
-                    # 基本的にカットは１ターンにする
-                    def_cut = 0.0
-
-                    for elem in buffs:
-                        new_list = []
-                        
-                        for b in buffs[elem]:
-                            b["count"] -= 1
-                            
-                            if b["count"] > 0:
-                                new_list.append(b)
-                        buffs[elem] = new_list
+            frames.lap("events")
+            # 制限時間はゲームの時計で測る (描画が遅れても、ステップごとに見る)
+            if drag_src is not None and drg_start_time is not None:
+                if step.now - drg_start_time >= time_limit:
+                    turn_ready = True
+                    drag_src = None
+                    drag_elem = None
+                    message = "Time Up!"
 
-                    pg.event.clear()
-                    turn_processed = False
+            if turn_ready:
+                turn_ready = False
+                turn_processed = True
+                start_turn()
 
+            timeline.update(step.dt)
 
+            if current_processing is None and len(skill_queue) > 0:
+                current_processing = skill_queue.pop(0)
+                current_processing["start_time"] = timeline.now
 
+                s_name = current_processing["data"].skills
 
-        if current_processing is None and len(skill_queue) > 0:
-            current_processing = skill_queue.pop(0)
-            current_processing["start_time"] = time.time()
-            
-            s_name = current_processing["data"]["skills"]
+            if current_processing is not None:
+                elapsed = timeline.now - current_processing["start_time"]
 
-        if current_processing is not None:
-            now = time.time()
-            elapsed = now - current_processing["start_time"]
+                if elapsed >= 2.0:
+                    message = activate_skill(game, current_processing["index"], pulse_gem)
+                    current_processing = None
 
-            if elapsed >= 2.0:
-                target_data = current_processing["data"]
-                
-                res_msg, defc = skills(target_data, field, buffs, gem_animations, enemy, def_cut)
-                def_cut = defc
-                print(def_cut)
-                message = res_msg
-                
-                current_processing = None
-                
-                # スキルによる撃破
-                if enemy["hp"] <= 0:
-                    message = f"{enemy['name']} を倒した！"
-                    enemy_idx += 1
-                    
-                    if enemy_idx < len(enemies):
-                        enemy = enemies[enemy_idx]
-                        message += f" 次は {enemy['name']}"
-                    else:
-                        message = "ダンジョン制覇！おめでとう！（ESCで終了）"
+        frames.lap("logic")
 
-        screen.fill((22, 22, 28))
-        draw_top(screen, enemy, party, font, sukill_turn )
-        
-        draw_field(screen, field, font, gem_animations, hover_pos=hover_pos, drag_src=drag_src, drag_elem=drag_elem)
+        # ここから描画。タイムラインの値は、最後のステップから今までに進んだぶんを足した時刻で見る
+        timeline.lead = step.alpha() * step.dt * timeline.speed
+        ensure_enemy_image(game, assets)
+        compose_top(comp, game.enemy, party, font, sukill_turn, timeline)
+        board = view if view is not None else field
+        field_layer.compose(comp, board, timeline, hover_pos=hover_pos, drag_src=drag_src, drag_elem=drag_elem, falling=falling)
+        frames.lap("draw")
+        animation_fall(comp, falling, timeline.value("fall"))
+        frames.lap("fall")
         
-        
-        if drag_src is not None:
-            if drg_start_time > 0:
-                mx, my = pg.mouse.get_pos()
-                draw_timer_bar(screen, mx, my, drg_start_time)
-
-        draw_message(screen, message, font)
+        if drag_src is not None and drg_start_time is not None:
+            mx, my = pg.mouse.get_pos()
+            ratio = timer_ratio(drg_start_time, step.clock())
+            # 色が変わるところでも描き直す
+            state = (mx, my, int(60 * ratio), ratio > 0.5, ratio > 0.2)
+            comp.part("overlay", "timer", state, lambda s, mx=mx, my=my, r=ratio: draw_timer_bar(s, mx, my, r))
+        else:
+            comp.clear("overlay", "timer")
+
+        if hint_path is not None and timeline.value("hint") is not None:
+            comp.part("overlay", "hint", tuple(hint_path), lambda s, p=hint_path: draw_hint(s, p))
+        else:
+            hint_path = None
+            comp.clear("overlay", "hint")
+
+        if drag_src is not None and preview is not None:
+            mx, my = pg.mouse.get_pos()
+            state = (mx, my, preview.combo, preview.cleared)
+            comp.part("overlay", "preview", state, lambda s, st=state: draw_preview(s, *st, font))
+        else:
+            comp.clear("overlay", "preview")
+
+        comp.part("overlay", "message", message, lambda s, t=message: draw_message(s, t, font))
     
         if current_processing is not None:
-            # 暗幕
-            overlay = pg.Surface((WIN_W, WIN_H), pg.SRCALPHA)
-            overlay.fill((0, 0, 0, 150))
-            screen.blit(overlay, (0, 0))
-
-            # キャラ画像や文字
             p_data = current_processing["data"]
-            
-            img = p_data["display_image"]
-            big_img = pg.transform.scale(img, (256, 256)) 
-            img_rect = big_img.get_rect(center=(WIN_W//2, WIN_H//2 - 50))
-            screen.blit(big_img, img_rect)
-            
-            skill_name = p_data["skills"]
-            text_surf = font.render(skill_name, True, (255, 255, 0))
-            text_rect = text_surf.get_rect(center=(WIN_W//2, WIN_H//2 + 100))
-            screen.blit(text_surf, text_rect)
-
-        pg.display.flip()
-        clock.tick(60)
-
-
+            comp.part("cutin", "cutin", (current_processing["index"], current_processing["start_time"]), lambda s, p=p_data: draw_cutin(s, p, font))
+        else:
+            comp.clear("cutin", "cutin")
+
+        if show_pixels:
+            px = comp.pixels
+            comp.part("overlay", "pixels", px, lambda s, px=px: s.blit(font.render(f"{px:,} px/frame", True, (255, 255, 0)), (4, 4)))
+
+        if show_frametime:
+            # 毎フレーム作り直すと表示自体が重くなるので、0.5秒ごとに更新する
+            comp.part("hud", "frametime", frames.count // 30,
+                      lambda s: draw_frame_hud(s, hud_lines(frames.stats()), hud_font))
+        frames.lap("draw")
+
+        comp.present()
+        timeline.lead = 0.0
+        frames.lap("present")
+
+
+    autosaver.write(log_path, encode_log(game.log))
+    autosaver.close()
+    if bot["pool"] is not None:
+        bot["pool"].shutdown(wait=False)
+    if frametime_csv:
+        frames.dump_csv(frametime_csv)
+    assets.close()
     pg.quit()
     sys.exit()
 
 if __name__=="__main__":
-    main()
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seed", type=parse_seed, default=None, help="乱数のシード (符号つき64ビット。省略するとランダム)")
+    ap.add_argument("--log", default=None, help="ターンログの保存先 (省略すると replays/ の下)")
+    ap.add_argument("--speed", type=float, default=1.0, help="アニメーションの速さ (2で倍速)")
+    ap.add_argument("--frametime-csv", default=None, help="終了時にフレーム時間をCSVで保存する")
+    ap.add_argument("--save", default=None, help="オートセーブの保存先 (省略すると saves/autosave.sav)")
+    ap.add_argument("--load", default=None, help="セーブデータの続きから遊ぶ")
+    ap.add_argument("--size", type=parse_size, default=(BOARD_ROWS, BOARD_COLS),
+                    help=f"盤面の大きさ 列x行 (6x5 から 14x10 まで。省略すると {BOARD_COLS}x{BOARD_ROWS})")
+    ap.add_argument("--log-level", type=debuglog.parse_levels, default=None,
+                    help=f"デバッグ用のログ (例: debug / rules=debug,input=info。省略すると ${debuglog.ENV} か warn)")
+    args = ap.parse_args()
+    if args.log_level is not None:
+        debuglog.configure(args.log_level)
+    if args.load is not None:
+        # 壊れていたら画面を開く前に止める
+        try:
+            read_game(args.load)
+        except (OSError, ValueError) as e:
+            ap.error(f"--load のセーブデータを読めません: {e}")
+    rows, cols = args.size
+    main(args.seed, args.log, args.speed, args.frametime_csv, save_path=args.save, load_path=args.load,
+         rows=rows, cols=cols)
@@ -0,0 +1,75 @@
+import json
+import os
+import random
+from typing import List, Optional, Tuple
+
+from board import SLOTS, BOARD_ROWS, BOARD_COLS
+
+# ---------------- 乱数 ----------------
+# 用途ごとに乱数を分けておく。スキルを1回多く使っても落ちてくるジェムは変わらない
+STREAMS = ("board", "skyfall", "damage", "skills")
+# セーブデータには符号つき64ビットで入れるので、シードはこの範囲まで
+SEED_MIN, SEED_MAX = -2 ** 63, 2 ** 63 - 1
+
+def parse_seed(text: str) -> int:
+    seed = int(text)
+    if not SEED_MIN <= seed <= SEED_MAX:
+        raise ValueError(f"シードは {SEED_MIN} から {SEED_MAX} までです: {seed}")
+    return seed
+
+class RngStreams:
+    def __init__(self, seed: Optional[int] = None):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.seed = seed
+        for name in STREAMS:
+            setattr(self, name, random.Random(f"{seed}:{name}"))
+
+# ---------------- ターンログ ----------------
+# {"version": 1, "seed": 123, "rows": 5, "cols": 6, "turns": [{"skills": [1], "path": "C2D2D3"}, ...]}
+# rows / cols は盤面の大きさ。入っていない古いログは 6x5
+# skills はそのターンのドラッグ前に発動したパーティの番号、path はドラッグの軌跡
+# path が None のものは、スキルだけ使って終わったターン
+LOG_VERSION = 1
+
+def encode_path(path: List[Tuple[int, int]]) -> str:
+    # 1マス2文字 (列の英字 + 行の数字)
+    return "".join(f"{SLOTS[x]}{y}" for x, y in path)
+
+def decode_path(text: str) -> List[Tuple[int, int]]:
+    return [(SLOTS.index(text[i]), int(text[i + 1])) for i in range(0, len(text), 2)]
+
+def new_log(seed: int, rows: int = BOARD_ROWS, cols: int = BOARD_COLS) -> dict:
+    return {"version": LOG_VERSION, "seed": seed, "rows": rows, "cols": cols, "turns": []}
+
+def log_size(log: dict) -> Tuple[int, int]:
+    return log.get("rows", BOARD_ROWS), log.get("cols", BOARD_COLS)
+
+def _pending(log: dict) -> dict:
+    turns = log["turns"]
+    if not turns or turns[-1]["path"] is not None:
+        turns.append({"skills": [], "path": None})
+    return turns[-1]
+
+def log_skill(log: dict, index: int):
+    _pending(log)["skills"].append(index)
+
+def log_turn(log: dict, path: List[Tuple[int, int]]):
+    _pending(log)["path"] = encode_path(path)
+
+def encode_log(log: dict) -> bytes:
+    return json.dumps(log, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def save_log(log: dict, path: str):
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(encode_log(log))
+
+def load_log(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        log = json.load(f)
+    if log.get("version") != LOG_VERSION:
+        raise ValueError(f"対応していないログのバージョンです: {log.get('version')}")
+    return log
@@ -0,0 +1,47 @@
+import argparse
+import time
+
+from record import RngStreams, load_log, log_size, decode_path
+import rules
+
+# ---------------- リプレイ ----------------
+# python3 replay.py replays/20260101-120000_123.json
+
+def replay(log: dict, verbose: bool = False) -> dict:
+    game = rules.new_game(RngStreams(log["seed"]), *log_size(log))
+
+    for n, t in enumerate(log["turns"]):
+        for i in t["skills"]:
+            rules.activate_skill(game, i)
+        if t["path"] is None:
+            continue
+
+        events = rules.play_turn(game, decode_path(t["path"]))
+        if verbose:
+            enemy = game.enemy
+            print(f"turn {n + 1:3d}: combo {events[-1]['combo']:2d}  "
+                  f"party {game.party.hp:4d}  {enemy.name} {enemy.hp}/{enemy.max_hp}")
+    return game
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("log", help="ターンログ (json)")
+    ap.add_argument("-v", "--verbose", action="store_true", help="ターンごとの結果を表示")
+    args = ap.parse_args()
+
+    log = load_log(args.log)
+    start = time.perf_counter()
+    game = replay(log, args.verbose)
+    elapsed = time.perf_counter() - start
+
+    # 記録し直したログが元と同じなら、同じ手順を踏めている
+    same = game.log["turns"] == log["turns"]
+
+    rows, cols = log_size(log)
+    print(f"seed: {log['seed']}  board: {cols}x{rows}  turns: {game.turn}  ({elapsed * 1000:.1f} ms)")
+    print(f"倒した敵: {min(game.enemy_idx, len(game.enemies))}/{len(game.enemies)}")
+    print(f"パーティHP: {game.party.hp}/{game.party.max_hp}")
+    print(f"ログ一致: {'OK' if same else 'NG'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import json
+import os
+import random
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+from board import GEMS, BOARD_ROWS, BOARD_COLS, init_field, resolve_turn
+from record import RngStreams, new_log, log_skill, log_turn
+from state import Unit, Party, Buff, GameState
+import debuglog
+
+# ---------------- ゲームのルール ----------------
+# パーティと敵、ダメージ計算、スキル、ターンの進め方。pygame は使わない。
+# シミュレーター・リプレイ・ソルバーはこれだけ import すれば動く (画面もSDLも立ち上がらない)
+log = debuglog.get("rules")
+
+# ---------------- パラメータ(可変ではなくなったぜ) ----------------
+time_limit = 12.0
+partylist = [
+    {"name":"青龍","element":"風","hp":150,"max_hp":150,"ap":15,"dp":10,"skills":"竜巻"},
+    {"name":"朱雀","element":"火","hp":150,"max_hp":150,"ap":25,"dp":10,"skills":"火を纏う"},
+    {"name":"白虎","element":"土","hp":150,"max_hp":150,"ap":20,"dp":5,"skills":"引っ掻く"},
+    {"name":"玄武","element":"水","hp":150,"max_hp":150,"ap":20,"dp":15,"skills":"鉄壁"},
+    {"name":"青龍","element":"風","hp":150,"max_hp":150,"ap":15,"dp":10,"skills":"竜巻"},
+    {"name":"朱雀","element":"火","hp":150,"max_hp":150,"ap":25,"dp":10,"skills":"火を纏う"},
+]
+
+# ---------------- ダメージ/回復 ----------------
+def jitter(v:float, r:float=0.10, rng=random)->int:
+    return max(1, int(v*rng.uniform(1-r,1+r)))
+
+def attr_coeff(att,defe):
+    cyc={"火":"風","風":"土","土":"水","水":"火"}
+    if att in cyc and cyc[att]==defe: return 2.0
+    if defe in cyc and cyc[defe]==att: return 0.5
+    return 1.0
+
+def party_attack_from_gems(elem:str, run_len:int, combo:int, party:Party, monster:Unit, buffs, rng=random)->int:
+    combo_coeff = 1.5 ** ((run_len - 3) + combo)
+    if elem=="命":
+        heal=jitter(20*combo_coeff, rng=rng); party.hp=min(party.max_hp, party.hp+heal); return 0
+    ally = next((a for a in party.allies if a.element==elem), None)
+    if not ally: return 0
+    base=max(1, ally.ap -monster.dp)
+    log.debug("elem: %s buffs: %s", elem, buffs)
+    dmg=jitter(base*attr_coeff(elem,monster.element)*combo_coeff, rng=rng)*buffs
+    monster.hp=max(0,monster.hp-dmg); return dmg
+
+def enemy_attack(party:Party, monster:Unit, def_cut, rng=random)->int:
+    base=max(1, monster.ap-party.dp)
+    dmg=round(jitter(base, rng=rng)*(1 - def_cut)); party.hp=max(0,party.hp-dmg); return dmg
+
+# ---------------- skills ----------------
+# スキルの中身は skills.json に書いておき、読み込んだときに1回だけ種類ごとのクラスに変換する。
+# 数値 (num, elem, turn, make, ct) はそのときに取り出しておくので、発動するときは辞書を引かない。
+# 新しい種類のスキルは @skill_kind("キー") を付けたクラスを足して、skills.json にそのキーで書くだけ
+# on_gem(x, y, 秒) はジェムを変えたマスを知らせるコールバック (描画しないときは None)。
+# 画面側はそこで直接アニメーションを始めるので、マスごとの辞書やリストは作らない
+SKILLS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "skills.json")
+SKILL_KINDS = {}
+# makegem で変わったジェムが脈打つ時間 (秒)
+MAKEGEM_PULSE = 0.6
+
+def skill_kind(key: str):
+    def register(cls):
+        SKILL_KINDS[key] = cls
+        return cls
+    return register
+
+# __call__ を書き忘れた種類は、load_skills() でインスタンスを作るとき (import したとき) に TypeError になる
+class Skill(ABC):
+    def __init__(self, name: str, effect: str, ct: int):
+        self.name = name
+        self.effect = effect
+        self.ct = ct
+
+    @abstractmethod
+    def __call__(self, game, on_gem: Optional[Callable] = None) -> str:
+        # 効果を出して、表示するメッセージを返す
+        ...
+
+@skill_kind("buff")
+class BuffParty(Skill):
+    def __init__(self, name, effect, ct, params):
+        super().__init__(name, effect, ct)
+        self.elem = params["elem"]
+        self.num = params["num"]
+        self.turn = params["turn"]
+
+    def __call__(self, game, on_gem: Optional[Callable] = None) -> str:
+        game.buffs[self.elem].append(Buff(self.turn, self.num))
+        return self.effect
+
+@skill_kind("makegem")
+class MakeGem(Skill):
+    def __init__(self, name, effect, ct, params):
+        super().__init__(name, effect, ct)
+        # 作るジェムが複数種あるなら、そこからランダムに選ぶ
+        self.elem = tuple(params["elem"])
+        self.skip = frozenset(self.elem)
+        self.make = params["make"]
+
+    def __call__(self, game, on_gem: Optional[Callable] = None) -> str:
+        field = game.field
+        rng = game.streams.skills
+        not_target = [(x, y) for y, row in enumerate(field) for x, gem in enumerate(row) if gem not in self.skip]
+        if not not_target:
+            return self.effect
+
+        for x, y in rng.sample(not_target, min(len(not_target), self.make)):
+            field[y][x] = rng.choice(self.elem)
+            if on_gem is not None:
+                on_gem(x, y, MAKEGEM_PULSE)
+        return self.effect
+
+@skill_kind("attack")
+class Attack(Skill):
+    def __init__(self, name, effect, ct, params):
+        super().__init__(name, effect, ct)
+        # 0.5 -> 最大HPの50%
+        self.num = params["num"]
+
+    def __call__(self, game, on_gem: Optional[Callable] = None) -> str:
+        enemy = game.enemy
+        enemy.hp = max(0, enemy.hp - int(enemy.max_hp * self.num))
+        return self.effect
+
+@skill_kind("defence")
+class Defence(Skill):
+    def __init__(self, name, effect, ct, params):
+        super().__init__(name, effect, ct)
+        self.num = params["num"]
+
+    def __call__(self, game, on_gem: Optional[Callable] = None) -> str:
+        # 重ねがけはせず上書き
+        game.def_cut = self.num
+        return self.effect
+
+def compile_skill(name: str, data: dict) -> Skill:
+    kinds = [k for k in data if k in SKILL_KINDS]
+    if len(kinds) != 1:
+        raise ValueError(f"スキル {name} の種類が分かりません: {list(data)}")
+    return SKILL_KINDS[kinds[0]](name, str(data["effect"]), data["ct"], data[kinds[0]])
+
+def load_skills(path: str = SKILLS_PATH) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return {name: compile_skill(name, data) for name, data in json.load(f).items()}
+
+SKILLS = load_skills()
+
+def party_skills(allies) -> list:
+    # パーティの並び順ごとのスキル。見つからなければNone
+    return [SKILLS.get(member.skills) for member in allies]
+
+# ---------------- ゲーム進行 (描画なし) ----------------
+# main() とリプレイで同じ処理を通すために、盤面やパーティはまとめて1つの GameState で持つ
+def new_game(streams: RngStreams, rows: int = BOARD_ROWS, cols: int = BOARD_COLS) -> GameState:
+    allies = [Unit(**m) for m in partylist]
+    party = Party("Player", allies, party_skills(allies), hp=600, max_hp=600, dp=(10+10+5+15)/4)
+    enemies = [
+        Unit("スライム", "水", hp=100, max_hp=100, ap=10, dp=1),
+        Unit("ゴブリン", "土", hp=200, max_hp=200, ap=20, dp=5),
+        Unit("オオコウモリ", "風", hp=300, max_hp=300, ap=30, dp=10),
+        Unit("ウェアウルフ", "風", hp=400, max_hp=400, ap=40, dp=15),
+        Unit("ドラゴン", "火", hp=600, max_hp=600, ap=50, dp=20),
+    ]
+    field = init_field(streams.board, rows, cols)
+    return GameState(streams, new_log(streams.seed, rows, cols), field, party, enemies)
+
+def apply_path(field, path):
+    # ドラッグの軌跡どおりに隣同士を入れ替える
+    for (sx, sy), (nx, ny) in zip(path, path[1:]):
+        field[sy][sx], field[ny][nx] = field[ny][nx], field[sy][sx]
+
+def next_enemy(game) -> bool:
+    # 敵が倒れた -> 次の敵へ。もう敵がいなければFalse
+    game.enemy_idx += 1
+    if game.enemy_idx < len(game.enemies):
+        game.enemy = game.enemies[game.enemy_idx]
+        return True
+    return False
+
+def activate_skill(game, i, on_gem: Optional[Callable] = None) -> str:
+    log_skill(game.log, i)
+    game.sukill_turn[i] = 0
+    enemy = game.enemy
+
+    skill = game.party.slot_skills[i]
+    if skill is None:
+        message = "スキルデータが見つかりません"
+    else:
+        message = skill(game, on_gem)
+    log.debug("skill %d def_cut: %s", i, game.def_cut)
+
+    # スキルによる撃破
+    if enemy.hp <= 0:
+        message = f"{enemy.name} を倒した！"
+        if next_enemy(game):
+            message += f" 次は {game.enemy.name}"
+        else:
+            message = "ダンジョン制覇！おめでとう！（ESCで終了）"
+    return message
+
+def party_turn(game, combo, to_do) -> str:
+    party = game.party
+    enemy = game.enemy
+    buffs = game.buffs
+    rng = game.streams.damage
+    message = ""
+
+    # ダメージ・回復計算
+    for elem, value in to_do.items():
+        if value == 0:
+            continue
+
+        if elem == "命":
+            heal = jitter(20 * value, rng=rng)
+            party.hp = min(party.max_hp, party.hp + heal)
+            message = f"HP +{heal}"
+        else:
+            default = 1.00
+            for i in buffs[elem]:
+                default *= i.num
+
+            dmg = party_attack_from_gems(elem, value, combo, party, enemy, default, rng)
+            message = f"{elem}攻撃！ {dmg} ダメージ"
+
+    if enemy.hp <= 0:
+        message = f"{enemy.name} を倒した！"
+    return message
+
+def enemy_turn(game) -> tuple[str, bool]:
+    # 敵が生きていれば攻撃する。(メッセージ, 攻撃したか)
+    enemy = game.enemy
+    if enemy.hp > 0:
+        edmg = enemy_attack(game.party, enemy, game.def_cut, game.streams.damage)
+        return f"{enemy.name}の攻撃！ -{edmg}", True
+
+    if next_enemy(game):
+        return f"さらに奥へ… 次は {game.enemy.name}", False
+    return "ダンジョン制覇！おめでとう！（ESCで終了）", False
+
+def end_turn(game):
+    sukill_turn = game.sukill_turn
+    buffs = game.buffs
+
+    for i in range(len(sukill_turn)):
+        sukill_turn[i] += 1
+
+    log.debug("sukill_turn: %s", sukill_turn)
+    if log.debug_on:
+        for gem in buffs:
+            log.debug("buff : %s :%s", gem, buffs[gem])
+
+    game.turn += 1
+    # 基本的にカットは１ターンにする
+    game.def_cut = 0.0
+
+    for elem in buffs:
+        new_list = []
+        
+        for b in buffs[elem]:
+            b.count -= 1
+            
+            if b.count > 0:
+                new_list.append(b)
+        buffs[elem] = new_list
+
+def solver_weights(game) -> list:
+    # solver.py の点数の重み (GEMSの順)。party_turn と同じ計算で、乱数は無視する
+    party = game.party
+    enemy = game.enemy
+    weights = []
+    for elem in GEMS:
+        if elem == "命":
+            # 減っているぶんだけ回復に価値がある
+            weights.append(20 * (1 - party.hp / party.max_hp))
+            continue
+        ally = next((a for a in party.allies if a.element == elem), None)
+        if ally is None:
+            weights.append(0.0)
+            continue
+        buff = 1.0
+        for b in game.buffs[elem]:
+            buff *= b.num
+        weights.append(max(1, ally.ap - enemy.dp) * attr_coeff(elem, enemy.element) * buff)
+    return weights
+
+def play_turn(game, path) -> list:
+    # 描画なしで1ターン進める (リプレイ・シミュレーション用)
+    log_turn(game.log, path)
+    apply_path(game.field, path)
+    events = resolve_turn(game.field, game.streams.skyfall)
+    party_turn(game, events[-1]["combo"], events[-1]["to_do"])
+    enemy_turn(game)
+    end_turn(game)
+    return events
@@ -0,0 +1,177 @@
+import os
+import random
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from record import STREAMS, RngStreams, new_log
+from rules import new_game
+from state import GameState, Snapshot
+import debuglog
+
+# ---------------- セーブデータ ----------------
+# 途中から再開するためのバイナリ形式。シミュレーターのチェックポイントにも同じものを使う
+# (リトルエンディアン、上から順に)
+#   ヘッダ   : "PZMN", バージョン(u16), シード(i64。record.SEED_MIN〜SEED_MAX)
+#   状態     : 行数, 列数 (盤面の大きさ), 敵の数, 味方の数, 今の敵の番号 (各u8), ターン数(u32), def_cut(f64)
+#   盤面     : 行数*列数 バイト (GEMS の番号、5 が「無」)
+#   HP       : パーティ, 敵… (f64。バフの倍率で小数になることがある)
+#   スキル   : 味方ごとの sukill_turn (u32)
+#   バフ     : 個数(u16), (属性の番号 u8, 残りターン u16, 倍率 f64)…
+#   乱数     : STREAMS の順に Mersenne Twister の状態 (625 x u32) と gauss の続き (u8 + f64)
+#   ログ     : ターン数(u32), (スキルの数 u8, 番号 u8…, 軌跡の長さ u16 (0xFFFF は None), 軌跡)…
+# 味方や敵の名前・攻撃力などは new_game() と同じなので入れない
+MAGIC = b"PZMN"
+SAVE_VERSION = 1
+
+_HEAD = struct.Struct("<4sHq")
+_STATE = struct.Struct("<BBBBBId")
+_BUFF = struct.Struct("<BHd")
+_MT = struct.Struct("<625I")
+_GAUSS = struct.Struct("<?d")
+_NO_PATH = 0xFFFF
+
+def _number(v: float):
+    # 整数だったものは整数に戻す (表示が "100.0" にならないように)
+    return int(v) if v.is_integer() else v
+
+def dump_game(game: GameState) -> bytes:
+    snap = game.new_snapshot()
+    rows = len(game.field)
+    cols = len(game.field[0])
+    out = [
+        _HEAD.pack(MAGIC, SAVE_VERSION, game.streams.seed),
+        _STATE.pack(rows, cols, len(game.enemies), len(game.sukill_turn), snap.enemy_idx, snap.turn, snap.def_cut),
+        bytes(snap.board),
+        struct.pack(f"<{len(snap.hp)}d", *snap.hp),
+        struct.pack(f"<{len(snap.sukill_turn)}I", *snap.sukill_turn),
+        struct.pack("<H", len(snap.buffs) // 3),
+    ]
+    for n in range(0, len(snap.buffs), 3):
+        out.append(_BUFF.pack(*snap.buffs[n:n + 3]))
+
+    for name in STREAMS:
+        _, internal, gauss = getattr(game.streams, name).getstate()
+        out.append(_MT.pack(*internal))
+        out.append(_GAUSS.pack(gauss is not None, gauss or 0.0))
+
+    turns = game.log["turns"]
+    out.append(struct.pack("<I", len(turns)))
+    for t in turns:
+        out.append(struct.pack(f"<B{len(t['skills'])}B", len(t["skills"]), *t["skills"]))
+        if t["path"] is None:
+            out.append(struct.pack("<H", _NO_PATH))
+        else:
+            path = t["path"].encode("ascii")
+            out.append(struct.pack("<H", len(path)) + path)
+    return b"".join(out)
+
+def load_game(data: bytes) -> GameState:
+    # 途中で切れている / 中身が壊れているものは、どこで気づいても ValueError にする
+    try:
+        return _load_game(data)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"セーブデータが壊れています ({e})") from None
+
+def _load_game(data: bytes) -> GameState:
+    magic, version, seed = _HEAD.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("セーブデータではありません")
+    if version != SAVE_VERSION:
+        raise ValueError(f"対応していないセーブデータのバージョンです: {version}")
+    pos = _HEAD.size
+
+    rows, cols, n_enemies, n_allies, enemy_idx, turn, def_cut = _STATE.unpack_from(data, pos)
+    pos += _STATE.size
+    # 盤面の大きさはセーブデータのものに合わせる (check_size で範囲外は ValueError)
+    game = new_game(RngStreams(seed), rows, cols)
+    if (n_enemies, n_allies) != (len(game.enemies), len(game.sukill_turn)):
+        raise ValueError("セーブデータのパーティ・敵の数が今のゲームと合いません")
+
+    snap = Snapshot()
+    snap.board = bytearray(data[pos:pos + rows * cols])
+    if len(snap.board) != rows * cols:
+        raise ValueError("セーブデータが壊れています (盤面が途中で切れています)")
+    pos += rows * cols
+    snap.hp = [_number(v) for v in struct.unpack_from(f"<{1 + n_enemies}d", data, pos)]
+    pos += 8 * (1 + n_enemies)
+    snap.sukill_turn = list(struct.unpack_from(f"<{n_allies}I", data, pos))
+    pos += 4 * n_allies
+    n_buffs, = struct.unpack_from("<H", data, pos)
+    pos += 2
+    snap.buffs = []
+    for _ in range(n_buffs):
+        snap.buffs.extend(_BUFF.unpack_from(data, pos))
+        pos += _BUFF.size
+    snap.enemy_idx = enemy_idx
+    snap.turn = turn
+    snap.def_cut = def_cut
+    game.load(snap)
+
+    for name in STREAMS:
+        internal = _MT.unpack_from(data, pos)
+        pos += _MT.size
+        has_gauss, gauss = _GAUSS.unpack_from(data, pos)
+        pos += _GAUSS.size
+        getattr(game.streams, name).setstate((random.Random.VERSION, internal, gauss if has_gauss else None))
+
+    log = new_log(seed, rows, cols)
+    n_turns, = struct.unpack_from("<I", data, pos)
+    pos += 4
+    for _ in range(n_turns):
+        n_skills = data[pos]
+        skills = list(data[pos + 1:pos + 1 + n_skills])
+        pos += 1 + n_skills
+        length, = struct.unpack_from("<H", data, pos)
+        pos += 2
+        path = None
+        if length != _NO_PATH:
+            path = data[pos:pos + length].decode("ascii")
+            pos += length
+        log["turns"].append({"skills": skills, "path": path})
+    game.log = log
+    return game
+
+def write_file(path: str, data: bytes):
+    # 書いている途中で落ちても前のファイルが残るように、別名で書いてから置き換える
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def save_game(game: GameState, path: str):
+    write_file(path, dump_game(game))
+
+def read_game(path: str) -> GameState:
+    with open(path, "rb") as f:
+        return load_game(f.read())
+
+log = debuglog.get("save")
+
+def _report(future):
+    if future.exception() is not None:
+        log.error("セーブできませんでした (%s)", future.exception())
+
+class Autosaver:
+    # バイト列にするのは呼んだスレッド (その時点の状態を取るため)、ファイルに書くのは裏の1本のスレッド。
+    # 順番どおりに書くので、同じファイルに何回書いても最後のものが残る
+    def __init__(self):
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+
+    def write(self, path: str, data: bytes):
+        self._worker.submit(write_file, path, data).add_done_callback(_report)
+
+    def save(self, game: GameState, path: str):
+        # バイト列にできなくても (入らないシードなど) ゲームは止めずにログに出すだけ
+        try:
+            data = dump_game(game)
+        except (struct.error, ValueError, OverflowError) as e:
+            log.error("セーブできませんでした (%s)", e)
+            return
+        self.write(path, data)
+
+    def close(self):
+        # 書きかけのものは最後まで書く
+        self._worker.shutdown(wait=True)
@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import json
+import os
+from typing import Optional
+
+from board import GEMS, BOARD_ROWS, BOARD_COLS, parse_size
+from record import RngStreams, decode_path, save_log
+import debuglog
+import rules
+
+# ---------------- 対戦用サーバー ----------------
+# python3 server.py --port 8765            (--unix /tmp/pazmon.sock で Unix ソケット)
+# 1つのプロセスで、接続ごとに1つずつゲームを持つ。ルールは rules.py をそのまま使う (描画なし)
+# やりとりは1行1つの JSON。1つの要求に1つの返事を、来た順に返す
+#   {"op": "new", "seed": 123, "size": "6x5"}   新しいゲーム (seed / size は省略可) -> 全部の状態
+#   {"op": "state"}                             全部の状態
+#   {"op": "skill", "index": 2}                 パーティの番号でスキルを使う -> 変わったところ
+#   {"op": "turn", "path": "C2D2D3"}            ドラッグの軌跡 (ターンログと同じ書き方) -> 変わったところ
+# 返事の中身 (変わったところには、前の返事から変わったものだけ入る)
+#   board: 行ごとの文字列 (GEMS の番号、5 が「無」)    cells: 変わったマス [マスの番号, 属性の番号, ...] (番号は y * cols + x)
+#   hp: 全部の状態では [パーティ, 敵…]、変わったところでは [番号, HP, ...] (0 がパーティ、1〜 が敵)
+#   enemy: 今の敵の番号    sukill_turn / ready: スキルのターン / 使えるスキルの番号
+#   buffs: [属性の番号, 残りターン, 倍率, ...]    turn / def_cut    combo / message    over: "won" / "lost"
+# おかしな要求には {"error": "..."} を返して、接続はそのまま
+log = debuglog.get("server")
+# 1手でドラッグできるのは、60fps で1フレームに1マスずつ動かしたときの最大まで
+MAX_PATH = int(rules.time_limit * 60) + 1
+# 数百の接続が一度に来ても待たせないように (asyncio の既定は 100)
+BACKLOG = 1024
+
+def check_path(path, rows: int, cols: int):
+    if not 2 <= len(path) <= MAX_PATH:
+        raise ValueError(f"軌跡の長さは 2 から {MAX_PATH} マスまでです")
+    for x, y in path:
+        if not (0 <= x < cols and 0 <= y < rows):
+            raise ValueError(f"盤面の外です: {x},{y}")
+    for (sx, sy), (nx, ny) in zip(path, path[1:]):
+        # ゲームと同じく、斜めも含めて隣のマスにしか動けない
+        if max(abs(sx - nx), abs(sy - ny)) != 1:
+            raise ValueError(f"隣のマスではありません: {sx},{sy} -> {nx},{ny}")
+
+class Session:
+    def __init__(self, seed: Optional[int] = None, rows: int = BOARD_ROWS, cols: int = BOARD_COLS):
+        self.game = rules.new_game(RngStreams(seed), rows, cols)
+        # 要求の前後の状態。毎回作らずに2つを入れ替えて使う
+        self._before = self.game.new_snapshot()
+        self._after = self.game.new_snapshot()
+
+    def over(self) -> Optional[str]:
+        game = self.game
+        if game.enemy_idx >= len(game.enemies):
+            return "won"
+        if game.party.hp <= 0:
+            return "lost"
+        return None
+
+    def ready(self) -> list:
+        game = self.game
+        return [i for i, skill in enumerate(game.party.slot_skills)
+                if skill is not None and game.sukill_turn[i] >= skill.ct]
+
+    def state(self) -> dict:
+        game = self.game
+        snap = self._before
+        game.save(snap)
+        cols = len(game.field[0])
+        board = "".join(map(str, snap.board))
+        return {
+            "seed": game.streams.seed,
+            "size": f"{cols}x{len(game.field)}",
+            "gems": GEMS,
+            "board": [board[i:i + cols] for i in range(0, len(board), cols)],
+            "hp": snap.hp,
+            "max_hp": [game.party.max_hp] + [e.max_hp for e in game.enemies],
+            "enemy": snap.enemy_idx,
+            "sukill_turn": snap.sukill_turn,
+            "ready": self.ready(),
+            "buffs": snap.buffs,
+            "turn": snap.turn,
+            "def_cut": snap.def_cut,
+            "over": self.over(),
+        }
+
+    def skill(self, index) -> dict:
+        game = self.game
+        if self.over():
+            raise ValueError("ゲームは終わっています")
+        # True / False も int なので先に外す
+        if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < len(game.sukill_turn):
+            raise ValueError(f"パーティの番号ではありません: {index}")
+        skill = game.party.slot_skills[index]
+        if skill is None or game.sukill_turn[index] < skill.ct:
+            raise ValueError(f"まだスキルを使えません: {index}")
+        message = rules.activate_skill(game, index)
+        return self._delta({"message": message})
+
+    def turn(self, text) -> dict:
+        game = self.game
+        if self.over():
+            raise ValueError("ゲームは終わっています")
+        if not isinstance(text, str):
+            raise ValueError(f"軌跡は \"C2D2D3\" のような文字列です: {text!r}")
+        try:
+            path = decode_path(text)
+        except (TypeError, ValueError, IndexError):
+            raise ValueError(f"軌跡が読めません: {text!r}")
+        check_path(path, len(game.field), len(game.field[0]))
+        events = rules.play_turn(game, path)
+        return self._delta({"combo": events[-1]["combo"]})
+
+    def _delta(self, out: dict) -> dict:
+        # _before (前の返事のときの状態) と比べて変わったものだけ入れる
+        game = self.game
+        old, new = self._before, self._after
+        game.save(new)
+
+        cells = []
+        for i, (a, b) in enumerate(zip(old.board, new.board)):
+            if a != b:
+                cells += (i, b)
+        if cells:
+            out["cells"] = cells
+        hp = []
+        for i, (a, b) in enumerate(zip(old.hp, new.hp)):
+            if a != b:
+                hp += (i, b)
+        if hp:
+            out["hp"] = hp
+        if new.enemy_idx != old.enemy_idx:
+            out["enemy"] = new.enemy_idx
+        if new.sukill_turn != old.sukill_turn:
+            out["sukill_turn"] = new.sukill_turn
+            out["ready"] = self.ready()
+        if new.buffs != old.buffs:
+            out["buffs"] = new.buffs
+        if new.turn != old.turn:
+            out["turn"] = new.turn
+        if new.def_cut != old.def_cut:
+            out["def_cut"] = new.def_cut
+        over = self.over()
+        if over:
+            out["over"] = over
+
+        self._before, self._after = new, old
+        return out
+
+class Server:
+    def __init__(self, log_dir: Optional[str] = None):
+        self.log_dir = log_dir
+
+    def handle(self, session: Optional[Session], req: dict) -> tuple[Optional[Session], dict]:
+        op = req.get("op")
+        if op == "new":
+            # おかしな new では今のゲームをそのまま続けるので、確かめてから前のゲームを閉じる
+            size = req.get("size", f"{BOARD_COLS}x{BOARD_ROWS}")
+            if not isinstance(size, str):
+                raise ValueError(f"size は \"8x6\" のような文字列です: {size!r}")
+            rows, cols = parse_size(size)
+            seed = req.get("seed")
+            if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+                raise ValueError(f"seed は整数です: {seed!r}")
+            self._finish(session)
+            session = Session(seed, rows, cols)
+            return session, session.state()
+        if session is None:
+            raise ValueError("先に new でゲームを始めてください")
+        if op == "state":
+            return session, session.state()
+        if op == "skill":
+            return session, session.skill(req.get("index"))
+        if op == "turn":
+            return session, session.turn(req.get("path"))
+        raise ValueError(f"分からない op です: {op!r}")
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    req = json.loads(line)
+                    if not isinstance(req, dict):
+                        raise ValueError("JSON のオブジェクトではありません")
+                    session, out = self.handle(session, req)
+                except ValueError as e:
+                    out = {"error": str(e)}
+                except Exception as e:
+                    # 思っていなかった要求でも、その1つにエラーを返すだけで接続は切らない
+                    log.error("要求の処理に失敗しました: %r (%s: %s)", line[:200], type(e).__name__, e)
+                    out = {"error": f"要求を処理できませんでした ({type(e).__name__})"}
+                writer.write(json.dumps(out, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            # 切れた / 1行が長すぎる (readline は ValueError にする)
+            pass
+        finally:
+            self._finish(session)
+            writer.close()
+
+    def _finish(self, session: Optional[Session]):
+        # 終わったゲームのターンログは replay.py で再生できる
+        if session is not None and self.log_dir and session.game.log["turns"]:
+            game = session.game
+            save_log(game.log, os.path.join(self.log_dir, f"{game.streams.seed}_{id(session):x}.json"))
+
+async def run(args):
+    server = Server(args.save_logs)
+    if args.unix:
+        srv = await asyncio.start_unix_server(server.serve, path=args.unix, backlog=BACKLOG)
+        where = args.unix
+    else:
+        srv = await asyncio.start_server(server.serve, args.host, args.port, backlog=BACKLOG)
+        host, port = srv.sockets[0].getsockname()[:2]
+        where = f"{host}:{port}"
+    # bench_server.py はこの1行でつなぎ先を知る
+    print(f"listening {where}", flush=True)
+    async with srv:
+        await srv.serve_forever()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765, help="0 なら空いているポート")
+    ap.add_argument("--unix", default=None, help="TCP ではなくこの Unix ソケットで待つ")
+    ap.add_argument("--save-logs", default=None, help="終わったゲームのターンログの保存先")
+    ap.add_argument("--log-level", type=debuglog.parse_levels, default=None,
+                    help=f"デバッグ用のログ (例: rules=debug。省略すると ${debuglog.ENV} か warn)")
+    args = ap.parse_args()
+    if args.log_level is not None:
+        debuglog.configure(args.log_level)
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
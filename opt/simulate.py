@@ -0,0 +1,229 @@
+import argparse
+import importlib
+import json
+import os
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+from multiprocessing.util import Finalize
+
+from board import BOARD_ROWS, BOARD_COLS, parse_size, resolve_turn
+from record import RngStreams, log_turn, save_log
+from savegame import read_game
+from solver import solve
+import debuglog
+import rules
+
+# ---------------- ダンジョンのモンテカルロ ----------------
+# python3 simulate.py -n 2000 -j 8 --policy solver
+# 1回のプレイは seed (= --seed + 番号) だけで決まる。同じ seed なら何度やっても同じ結果
+# 手の選び方 (policy) は policy(game, rng) -> (使うスキルの番号のリスト, ドラッグの軌跡)
+# --policy には下の POLICIES の名前か、"モジュール名:関数名" を渡せる
+# --from にセーブデータ (pazmon.py のオートセーブなど) を渡すと、その続きから n 回遊ぶ。
+# 盤面やHPはセーブデータのまま、乱数だけ seed から作り直すので、毎回違う続きになる
+MAX_TURNS = 300
+
+def ready_skills(game) -> list:
+    # クールダウンが終わっているスキル
+    ready = []
+    turns = game.sukill_turn
+    for i, skill in enumerate(game.party.slot_skills):
+        if skill is not None and turns[i] >= skill.ct:
+            ready.append(i)
+    return ready
+
+def random_path(rng, rows: int, cols: int, moves: int) -> list:
+    x, y = rng.randrange(cols), rng.randrange(rows)
+    path = [(x, y)]
+    while len(path) <= moves:
+        nx = min(cols - 1, max(0, x + rng.choice((-1, 0, 1))))
+        ny = min(rows - 1, max(0, y + rng.choice((-1, 0, 1))))
+        if (nx, ny) != (x, y):
+            x, y = nx, ny
+            path.append((x, y))
+    return path
+
+def random_policy(game, rng):
+    # スキルは使えるようになったらすぐ使い、10マスでたらめに動かす
+    field = game.field
+    return ready_skills(game), random_path(rng, len(field), len(field[0]), 10)
+
+def solver_policy(game, rng):
+    # ヒントと同じ幅で、時間ではなく手数で打ち切る (時間で切ると結果が毎回変わる)
+    field = game.field
+    res = solve(field, rules.solver_weights(game), rules.time_limit, budget=float("inf"), beam_width=8)
+    if res is None:
+        return ready_skills(game), random_path(rng, len(field), len(field[0]), 10)
+    return ready_skills(game), res["path"]
+
+POLICIES = {"random": random_policy, "solver": solver_policy}
+
+def load_policy(name: str):
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, func = name.partition(":")
+    return getattr(importlib.import_module(module), func)
+
+def play_one(args) -> dict:
+    seed, policy_name, log_dir, checkpoint, (rows, cols) = args
+    policy = load_policy(policy_name)
+    rng = random.Random(f"{seed}:policy")
+    if checkpoint is not None:
+        game = read_game(checkpoint)
+        game.streams = RngStreams(seed)
+    else:
+        game = rules.new_game(RngStreams(seed), rows, cols)
+    first_enemy = game.enemy_idx
+
+    damage = []
+    heal = []
+    skills = Counter()
+    enemy_turns = []
+    turns_on_enemy = 0
+
+    while game.turn < MAX_TURNS:
+        party = game.party
+        if party.hp <= 0 or game.enemy_idx >= len(game.enemies):
+            break
+
+        enemy_idx = game.enemy_idx
+        use, path = policy(game, rng)
+        for i in use:
+            rules.activate_skill(game, i)
+            skills[game.party.allies[i].skills] += 1
+        if game.enemy_idx != enemy_idx:
+            # スキルで倒した
+            enemy_turns.append(turns_on_enemy)
+            turns_on_enemy = 0
+            enemy_idx = game.enemy_idx
+            if enemy_idx >= len(game.enemies):
+                break
+
+        # play_turn と同じ流れで、途中のダメージと回復を数える
+        log_turn(game.log, path)
+        rules.apply_path(game.field, path)
+        events = resolve_turn(game.field, game.streams.skyfall)
+        enemy_hp, party_hp = game.enemy.hp, party.hp
+        rules.party_turn(game, events[-1]["combo"], events[-1]["to_do"])
+        damage.append(enemy_hp - game.enemy.hp)
+        heal.append(party.hp - party_hp)
+        rules.enemy_turn(game)
+        rules.end_turn(game)
+
+        turns_on_enemy += 1
+        if game.enemy_idx != enemy_idx:
+            enemy_turns.append(turns_on_enemy)
+            turns_on_enemy = 0
+
+    won = game.enemy_idx >= len(game.enemies)
+    if log_dir:
+        save_log(game.log, os.path.join(log_dir, f"{seed}.json"))
+    return {
+        "seed": seed,
+        "won": won,
+        "turns": game.turn,
+        "first_enemy": first_enemy,
+        "enemy_turns": enemy_turns,
+        "damage": damage,
+        "heal": heal,
+        "skills": dict(skills),
+    }
+
+def _init_worker(levels: dict):
+    debuglog.configure(levels)
+    # 子プロセスは atexit を通らずに終わるので、書き残したログはここで書く
+    Finalize(None, debuglog.flush, exitpriority=0)
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    s = sorted(values)
+    n = len(s)
+    return {f"p{p}": s[min(n - 1, int(p / 100 * n))] for p in (5, 25, 50, 75, 95)} | {"mean": sum(s) / n}
+
+def summarize(results: list, n_enemies: int) -> dict:
+    per_enemy = [[] for _ in range(n_enemies)]
+    skills = Counter()
+    damage = []
+    heal = []
+    for r in results:
+        for i, t in enumerate(r["enemy_turns"], r["first_enemy"]):
+            per_enemy[i].append(t)
+        skills.update(r["skills"])
+        damage += r["damage"]
+        heal += [h for h in r["heal"] if h]
+
+    games = len(results)
+    return {
+        "games": games,
+        "win_rate": sum(r["won"] for r in results) / games,
+        "turns": percentiles([r["turns"] for r in results]),
+        "turns_per_enemy": [percentiles(t) | {"reached": len(t)} for t in per_enemy],
+        "damage_per_turn": percentiles(damage),
+        "heal_per_turn": percentiles(heal),
+        "skill_uses_per_game": {k: v / games for k, v in skills.most_common()},
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=1000, help="プレイ回数")
+    ap.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="プロセス数")
+    ap.add_argument("--seed", type=int, default=0, help="最初のシード (n回目は seed + n)")
+    ap.add_argument("--policy", default="random", help=f"{'/'.join(POLICIES)} または モジュール名:関数名")
+    ap.add_argument("--save-logs", default=None, help="1回ごとのターンログの保存先 (replay.py で再生できる)")
+    ap.add_argument("--json", default=None, help="結果をJSONで保存する")
+    ap.add_argument("--from", dest="checkpoint", default=None, help="セーブデータの続きから遊ぶ")
+    ap.add_argument("--size", type=parse_size, default=(BOARD_ROWS, BOARD_COLS),
+                    help=f"盤面の大きさ 列x行 (省略すると {BOARD_COLS}x{BOARD_ROWS}。--from のときはセーブデータのまま)")
+    ap.add_argument("--log-level", type=debuglog.parse_levels, default="off",
+                    help="デバッグ用のログ (例: rules=debug)。省略すると出さない")
+    args = ap.parse_args()
+    if args.checkpoint and args.save_logs:
+        # 乱数を作り直すので、保存したログは replay.py で再生できない
+        ap.error("--from と --save-logs は一緒に使えません")
+
+    load_policy(args.policy)
+    if args.checkpoint:
+        # 壊れていたら子プロセスを作る前に止める
+        try:
+            read_game(args.checkpoint)
+        except (OSError, ValueError) as e:
+            ap.error(f"--from のセーブデータを読めません: {e}")
+    jobs = [(args.seed + i, args.policy, args.save_logs, args.checkpoint, args.size) for i in range(args.n)]
+    start = time.perf_counter()
+    # 1回ずつが独立しているので、コア数に比例して速くなる
+    # ログを出さないときは、ログを書いたところはレベルを比べるだけになる
+    debuglog.configure(args.log_level)
+    pool = Pool(args.jobs, initializer=_init_worker, initargs=(args.log_level,))
+    results = list(pool.imap_unordered(play_one, jobs, chunksize=max(1, args.n // (args.jobs * 8))))
+    # with で抜けると terminate() (SIGTERM) になるが、policy が pygame を import していると
+    # SDL が SIGTERM を握りつぶして子プロセスが終わらない。close して普通に終わらせる
+    pool.close()
+    pool.join()
+    elapsed = time.perf_counter() - start
+    results.sort(key=lambda r: r["seed"])
+
+    names = [e.name for e in rules.new_game(RngStreams(0)).enemies]
+    summary = summarize(results, len(names))
+
+    print(f"{summary['games']} 回 ({args.policy}, {args.jobs} プロセス, {elapsed:.1f} 秒, "
+          f"{summary['games'] / elapsed:.1f} 回/秒)")
+    print(f"勝率: {summary['win_rate'] * 100:.1f}%   ターン数 中央値 {summary['turns'].get('p50')}")
+    for name, t in zip(names, summary["turns_per_enemy"]):
+        if t["reached"]:
+            print(f"  {name:<8} 倒した回数 {t['reached']:6d}  ターン 中央値 {t['p50']:3d}  p95 {t['p95']:3d}")
+    d, h = summary["damage_per_turn"], summary["heal_per_turn"]
+    if d:
+        print(f"1ターンのダメージ: 平均 {d['mean']:.1f}  p50 {d['p50']:.0f}  p95 {d['p95']:.0f}")
+    if h:
+        print(f"1ターンの回復 (回復したターン): 平均 {h['mean']:.1f}  p50 {h['p50']:.0f}  p95 {h['p95']:.0f}")
+    print("1回あたりのスキル使用数: " + "  ".join(f"{k} {v:.2f}" for k, v in summary["skill_uses_per_game"].items()))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"policy": args.policy, "seed": args.seed, "summary": summary, "games": results},
+                      f, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
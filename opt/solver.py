@@ -0,0 +1,212 @@
+import argparse
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from board import GEMS, GEM_INDEX, bit_clusters, board_masks, init_field
+
+# ---------------- ドラッグの軌跡を探す ----------------
+# 盤面をバイト列 (0..4 が GEMS、EMPTY が「無」) と属性ごとのビットボードで持って、
+# 入れ替えるたびにビットボードは2ビット反転するだけで済ませる。
+# 同じ盤面・同じ指の位置に来たら打ち切る (置換表)。点数は盤面ごとに覚えておく
+#
+# 点数は party_attack_from_gems と同じ形:  Σ weights[属性] * 1.5 ** ((to_do[属性] - 3) + combo)
+# (「命」だけは回復なので weights * to_do)
+# weights は呼ぶ側 (rules.solver_weights) で敵の属性やパーティから決める
+EMPTY = len(GEMS)
+HEAL = GEM_INDEX["命"]
+# 人がドラッグするときの1マスあたりの時間。time_limit をこれで割った数まで動かす
+SECONDS_PER_MOVE = 0.3
+# MOUSEMOTION と同じで、斜めも隣
+NEIGHBORS = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy]
+# 同じダメージならコンボが多いほうを選ぶ
+COMBO_BONUS = 1.0
+# 点数が同じ候補を並べるときだけ使う、2つ並んでいるところの数の重み
+PAIR_BONUS = 0.1
+
+# ヒント (1フレームに収まるように) と自動プレイ (数秒かけていい) の設定
+HINT = {"budget": 0.010, "beam_width": 8, "workers": 1}
+BOT = {"budget": 2.0, "beam_width": 200, "workers": os.cpu_count() or 1}
+
+def max_moves(time_limit: float) -> int:
+    return max(1, int(time_limit / SECONDS_PER_MOVE))
+
+def field_to_cells(field: List[List[str]]) -> bytes:
+    return bytes(GEM_INDEX.get(e, EMPTY) for row in field for e in row)
+
+def cells_to_bitboards(cells) -> List[int]:
+    boards = [0] * len(GEMS)
+    for i, c in enumerate(cells):
+        if c != EMPTY:
+            boards[c] |= 1 << i
+    return boards
+
+def evaluate(cells: bytes, boards: List[int], rows: int, cols: int, weights) -> Tuple[float, int]:
+    # 落ちてくるジェムは分からないので、補充なしで連鎖が止まるまで消す
+    clusters = bit_clusters(boards, rows, cols)
+    if not clusters:
+        return 0.0, 0
+
+    cells = bytearray(cells)
+    combo = 0
+    to_do = [0.0] * len(GEMS)
+    while clusters:
+        for i, group in clusters:
+            combo += 1
+            # resolve_turn と同じ
+            to_do[i] += 1.00 + (group.bit_count() - 3) * 0.8
+            while group:
+                low = group & -group
+                cells[low.bit_length() - 1] = EMPTY
+                group ^= low
+
+        for x in range(cols):
+            column = [cells[y * cols + x] for y in range(rows) if cells[y * cols + x] != EMPTY]
+            column = [EMPTY] * (rows - len(column)) + column
+            for y in range(rows):
+                cells[y * cols + x] = column[y]
+
+        clusters = bit_clusters(cells_to_bitboards(cells), rows, cols)
+
+    score = 0.0
+    for i, (v, w) in enumerate(zip(to_do, weights)):
+        if not v:
+            continue
+        if i == HEAL:
+            # 回復は party_turn でコンボに関係なく 20 * to_do
+            score += w * v
+        else:
+            score += w * 1.5 ** ((v - 3) + combo)
+    return score + combo * COMBO_BONUS, combo
+
+def beam_search(cells: bytes, rows: int, cols: int, weights, starts, max_len: int,
+                beam_width: int, deadline: float) -> Optional[tuple]:
+    # (点数, コンボ, 軌跡) を返す。軌跡は drag_path と同じく始点 + 動いた先のマス
+    _, not_right, _ = board_masks(rows, cols)
+    table = set()
+    evals = {}
+    boards0 = cells_to_bitboards(cells)
+    beam = [(cells, boards0, start, (start,)) for start in starts]
+    best = None
+
+    for _ in range(max_len):
+        children = []
+        for key, boards, (x, y), path in beam:
+            if time.perf_counter() >= deadline:
+                break
+            prev = path[-2] if len(path) > 1 else None
+            a = y * cols + x
+            for dx, dy in NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < cols and 0 <= ny < rows) or (nx, ny) == prev:
+                    continue
+                b = ny * cols + nx
+                ea, eb = key[a], key[b]
+                moved = bytearray(key)
+                moved[a], moved[b] = eb, ea
+                nkey = bytes(moved)
+                if (nkey, nx, ny) in table:
+                    continue
+                table.add((nkey, nx, ny))
+
+                nboards = boards
+                if ea != eb:
+                    nboards = list(boards)
+                    m = (1 << a) | (1 << b)
+                    if ea != EMPTY:
+                        nboards[ea] ^= m
+                    if eb != EMPTY:
+                        nboards[eb] ^= m
+
+                ev = evals.get(nkey)
+                if ev is None:
+                    ev = evaluate(nkey, nboards, rows, cols, weights)
+                    evals[nkey] = ev
+                score, combo = ev
+
+                npath = path + ((nx, ny),)
+                if best is None or score > best[0]:
+                    best = (score, combo, npath)
+
+                pairs = 0
+                for bb in nboards:
+                    pairs += (bb & (bb >> 1) & not_right).bit_count() + (bb & (bb >> cols)).bit_count()
+                children.append((score + pairs * PAIR_BONUS, nkey, nboards, (nx, ny), npath))
+
+        if not children or time.perf_counter() >= deadline:
+            break
+        children.sort(key=lambda c: c[0], reverse=True)
+        beam = [c[1:] for c in children[:beam_width]]
+
+    return best
+
+def _search(args):
+    # プロセスプールから呼ぶ (pickleできるようにトップレベルに置く)
+    cells, rows, cols, weights, starts, max_len, beam_width, budget = args
+    return beam_search(cells, rows, cols, weights, starts, max_len, beam_width, time.perf_counter() + budget)
+
+def new_pool(workers: int = BOT["workers"]) -> ProcessPoolExecutor:
+    # 何回も探すときは1つのプールを使い回す (自動プレイのあいだ / ベンチマーク)。
+    # ゲームはSDLやボットのスレッドを持っているので、fork で複製せずに spawn で子プロセスを作る
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+def solve(field: List[List[str]], weights, time_limit: float = 12.0, budget: float = 1.0,
+          beam_width: int = 50, workers: int = 1, pool: Optional[ProcessPoolExecutor] = None) -> Optional[dict]:
+    # {"path": [(x, y), ...], "score": 点数, "combo": コンボ数}。動かせないときはNone
+    # workers が2以上なら pool (new_pool() で作ったもの) で並べて探す。省略するとその場で作って閉じる
+    rows = len(field)
+    cols = len(field[0])
+    cells = field_to_cells(field)
+    weights = list(weights)
+    max_len = max_moves(time_limit)
+    starts = [(x, y) for y in range(rows) for x in range(cols)]
+
+    if workers <= 1:
+        results = [_search((cells, rows, cols, weights, starts, max_len, beam_width, budget))]
+    else:
+        # 始点を分けて、それぞれのプロセスで別々に探す
+        chunks = [starts[i::workers] for i in range(workers)]
+        jobs = [(cells, rows, cols, weights, c, max_len, beam_width, budget) for c in chunks if c]
+        if pool is not None:
+            results = list(pool.map(_search, jobs))
+        else:
+            with new_pool(len(jobs)) as tmp:
+                results = list(tmp.map(_search, jobs))
+
+    results = [r for r in results if r is not None]
+    if not results:
+        return None
+    score, combo, path = max(results, key=lambda r: r[0])
+    return {"path": list(path), "score": score, "combo": combo}
+
+# ---------------- ベンチマーク ----------------
+# python3 solver.py -n 20
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20, help="盤面の数")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--time-limit", type=float, default=12.0, help="ドラッグの制限時間 (秒)")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    fields = [init_field(rng) for _ in range(args.n)]
+    weights = [1.0] * len(GEMS)
+
+    pool = new_pool()
+    for name, conf in (("hint", HINT), ("bot", BOT)):
+        combos = []
+        worst = 0.0
+        for f in fields:
+            start = time.perf_counter()
+            res = solve(f, weights, args.time_limit, **conf, pool=pool)
+            worst = max(worst, time.perf_counter() - start)
+            combos.append(res["combo"] if res else 0)
+        print(f"{name:<5} 平均 {sum(combos) / len(combos):5.2f} コンボ  最大 {max(combos):2d}  "
+              f"最長 {worst * 1000:7.1f} ms  (beam {conf['beam_width']}, workers {conf['workers']})")
+    pool.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+from typing import List, Optional
+
+from board import GEMS, GEM_INDEX
+
+# ---------------- ゲームの状態 ----------------
+# 味方・敵・バフ・ゲーム全体を __slots__ のクラスで持つ (辞書より小さくて、属性を引くのも速い)。
+# ソルバーやシミュレーターで何度も巻き戻すときは、GameState.new_snapshot() で器を1つ作っておき
+# save() / load() で中身だけ書き写す。盤面は属性の番号 (GEMS の順、EMPTY が「無」) のバイト列で持つ
+# 乱数 (streams) とターンログは入れない。巻き戻したあとは別の手を試すだけなので
+EMPTY = len(GEMS)
+CODE_NAMES = GEMS + ["無"]
+
+class Unit:
+    __slots__ = ("name", "element", "hp", "max_hp", "ap", "dp", "skills")
+
+    def __init__(self, name: str, element: str, hp: int, max_hp: int, ap: int, dp: int,
+                 skills: Optional[str] = None):
+        self.name = name
+        self.element = element
+        self.hp = hp
+        self.max_hp = max_hp
+        self.ap = ap
+        self.dp = dp
+        self.skills = skills
+
+class Party:
+    __slots__ = ("player_name", "allies", "slot_skills", "hp", "max_hp", "dp")
+
+    def __init__(self, player_name: str, allies: List[Unit], slot_skills: list, hp: int, max_hp: int, dp: float):
+        self.player_name = player_name
+        self.allies = allies
+        # allies と同じ並びのスキル (rules.party_skills)
+        self.slot_skills = slot_skills
+        self.hp = hp
+        self.max_hp = max_hp
+        self.dp = dp
+
+class Buff:
+    __slots__ = ("count", "num")
+
+    def __init__(self, count: int, num: float):
+        self.count = count
+        self.num = num
+
+    def __repr__(self):
+        return f"Buff(count={self.count}, num={self.num})"
+
+class Snapshot:
+    __slots__ = ("board", "hp", "sukill_turn", "enemy_idx", "turn", "def_cut", "buffs")
+
+class GameState:
+    __slots__ = ("streams", "log", "field", "party", "enemies", "enemy_idx", "enemy",
+                 "buffs", "sukill_turn", "turn", "def_cut")
+
+    def __init__(self, streams, log: dict, field: List[List[str]], party: Party, enemies: List[Unit]):
+        self.streams = streams
+        self.log = log
+        self.field = field
+        self.party = party
+        self.enemies = enemies
+        self.enemy_idx = 0
+        self.enemy = enemies[0]
+        # 属性ごとの効果中のバフ。効果時間が0になったら消す
+        self.buffs = {g: [] for g in GEMS}
+        # --- index -> hidari kara no junban de skill turn wo teigi ---
+        self.sukill_turn = [0] * len(party.allies)
+        self.turn = 0
+        # (1 - def_cut)を相手の攻撃力にかける。
+        self.def_cut = 0.0
+
+    def new_snapshot(self) -> Snapshot:
+        snap = Snapshot()
+        snap.board = bytearray(len(self.field) * len(self.field[0]))
+        # HP はバフの倍率で float になることがあるので array ではなくリスト (型はそのまま戻す)
+        snap.hp = [0] * (1 + len(self.enemies))
+        snap.sukill_turn = [0] * len(self.sukill_turn)
+        # (属性の番号, 残りターン, 倍率) を平たく並べる
+        snap.buffs = []
+        self.save(snap)
+        return snap
+
+    def save(self, snap: Snapshot):
+        # snap の中身を今の状態で上書きする (新しいオブジェクトは作らない)
+        board = snap.board
+        i = 0
+        for row in self.field:
+            for elem in row:
+                board[i] = GEM_INDEX.get(elem, EMPTY)
+                i += 1
+
+        hp = snap.hp
+        hp[0] = self.party.hp
+        for n, enemy in enumerate(self.enemies, 1):
+            hp[n] = enemy.hp
+        for n, t in enumerate(self.sukill_turn):
+            snap.sukill_turn[n] = t
+
+        snap.enemy_idx = self.enemy_idx
+        snap.turn = self.turn
+        snap.def_cut = self.def_cut
+
+        buffs = snap.buffs
+        buffs.clear()
+        for code, elem in enumerate(GEMS):
+            for b in self.buffs[elem]:
+                buffs.append(code)
+                buffs.append(b.count)
+                buffs.append(b.num)
+
+    def load(self, snap: Snapshot):
+        # save() したときの状態に戻す。盤面の行やリストは今あるものに書き戻す
+        board = snap.board
+        i = 0
+        for row in self.field:
+            for x in range(len(row)):
+                row[x] = CODE_NAMES[board[i]]
+                i += 1
+
+        hp = snap.hp
+        self.party.hp = hp[0]
+        for n, enemy in enumerate(self.enemies, 1):
+            enemy.hp = hp[n]
+        for n, t in enumerate(snap.sukill_turn):
+            self.sukill_turn[n] = t
+
+        self.enemy_idx = snap.enemy_idx
+        self.enemy = self.enemies[min(snap.enemy_idx, len(self.enemies) - 1)]
+        self.turn = snap.turn
+        self.def_cut = snap.def_cut
+
+        for elem in GEMS:
+            self.buffs[elem].clear()
+        buffs = snap.buffs
+        for n in range(0, len(buffs), 3):
+            self.buffs[GEMS[buffs[n]]].append(Buff(buffs[n + 1], buffs[n + 2]))
@@ -0,0 +1,134 @@
+import heapq
+import math
+from typing import Callable, Optional
+
+# ---------------- タイムライン ----------------
+# sleepで止めずに、メインループの固定ステップ (fixedstep.py) ごとに update(dt) を呼んで進める。
+# speed を上げると全部のアニメーションと待ち時間がそのぶん早く終わる
+
+EASINGS = {
+    "linear": lambda t: t,
+    "in_quad": lambda t: t * t,
+    "out_quad": lambda t: 1 - (1 - t) * (1 - t),
+    "in_out_sine": lambda t: (1 - math.cos(t * math.pi)) / 2,
+    # 0 -> 1 -> 0 (ジェムが脈打つ用)
+    "pulse": lambda t: math.sin(t * math.pi),
+}
+
+# tween の記録は使い終わったら _pool に戻して、次の tween() で使い回す (毎回オブジェクトを作らない)。
+# 終わる時刻は calls と同じくヒープで持つので、1ステップで見るのは終わるものだけ。
+# 上書きされた tween のヒープの項目は seq が合わなくなるので、出てきたときに捨てる
+class Tween:
+    __slots__ = ("key", "start", "duration", "ease", "on_done", "cell", "seq")
+
+    def __init__(self):
+        self.key = None
+        self.start = 0.0
+        self.duration = 0.0
+        self.ease = None
+        self.on_done = None
+        # 盤面のマスの tween なら (x, y)
+        self.cell = None
+        self.seq = 0
+
+class Timeline:
+    def __init__(self, speed: float = 1.0):
+        self.now = 0.0
+        self.speed = speed
+        self.tweens = {}
+        # (x, y) -> {種類: Tween}。動いているマスだけ入っている
+        self.cells = {}
+        self.calls = []
+        # (終わる時刻, seq, key)
+        self._ends = []
+        self._pool = []
+        self._seq = 0
+        # 描画するときだけ、最後のステップから進んだぶんの時間を入れておく (value() がその時刻の値になる)
+        self.lead = 0.0
+
+    def update(self, dt: float):
+        end = self.now + dt * self.speed
+        ends = self._ends
+
+        # 予約とtweenの終わりを時間の早い順に実行する。倍速で1フレームに何個も
+        # 来ても順番は変わらない(実行中に予約やtweenが増えてもいい)
+        while True:
+            while ends:
+                tw = self.tweens.get(ends[0][2])
+                if tw is not None and tw.seq == ends[0][1]:
+                    break
+                heapq.heappop(ends)
+            tw_at = ends[0][0] if ends else math.inf
+            call_at = self.calls[0][0] if self.calls else math.inf
+            if min(tw_at, call_at) > end:
+                break
+
+            if call_at <= tw_at:
+                self.now = max(self.now, call_at)
+                _, _, fn = heapq.heappop(self.calls)
+                fn()
+            else:
+                self.now = max(self.now, tw_at)
+                _, _, key = heapq.heappop(ends)
+                # on_done の中で同じ key の tween を作り直してもいいように、先に外して戻しておく
+                on_done = self._remove(self.tweens[key])
+                if on_done:
+                    on_done()
+
+        self.now = end
+
+    def tween(self, key, duration: float, ease: str = "linear", delay: float = 0.0,
+              on_done: Optional[Callable] = None, cell: Optional[tuple] = None) -> Tween:
+        # 同じkeyのtweenがあれば上書きする (前のものの on_done は呼ばない)
+        # 返した Tween は終わると使い回されるので、持っておかないこと
+        old = self.tweens.get(key)
+        if old is not None:
+            self._remove(old)
+        tw = self._pool.pop() if self._pool else Tween()
+        self._seq += 1
+        tw.key = key
+        tw.start = self.now + delay
+        tw.duration = duration
+        tw.ease = EASINGS[ease]
+        tw.on_done = on_done
+        tw.cell = cell
+        tw.seq = self._seq
+        self.tweens[key] = tw
+        if cell is not None:
+            self.cells.setdefault(cell, {})[key[0]] = tw
+        heapq.heappush(self._ends, (tw.start + duration, tw.seq, key))
+        return tw
+
+    def cell_tween(self, kind: str, x: int, y: int, duration: float, ease: str = "linear",
+                   on_done: Optional[Callable] = None) -> Tween:
+        # 盤面のマスの tween。key は (kind, x, y) で、cells からも引ける
+        return self.tween((kind, x, y), duration, ease, on_done=on_done, cell=(x, y))
+
+    def _remove(self, tw: Tween) -> Optional[Callable]:
+        del self.tweens[tw.key]
+        if tw.cell is not None:
+            kinds = self.cells[tw.cell]
+            del kinds[tw.key[0]]
+            if not kinds:
+                del self.cells[tw.cell]
+        on_done = tw.on_done
+        tw.on_done = None
+        tw.ease = None
+        self._pool.append(tw)
+        return on_done
+
+    def call(self, delay: float, fn: Callable):
+        self._seq += 1
+        heapq.heappush(self.calls, (self.now + delay, self._seq, fn))
+
+    def value(self, key) -> Optional[float]:
+        # イージング後の値。始まっていない / 終わっている / 無いときはNone
+        tw = self.tweens.get(key)
+        now = self.now + self.lead
+        if tw is None or now < tw.start:
+            return None
+        t = (now - tw.start) / tw.duration if tw.duration > 0 else 1.0
+        return tw.ease(min(1.0, t))
+
+    def busy(self) -> bool:
+        return bool(self.calls or self.tweens)